@@ -0,0 +1,399 @@
+import argparse
+import concurrent.futures
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+LIVE_HOSTS = ("https://www.vinted.co.uk", "https://images1.vinted.net")
+BENCH_TERM = "PS5 games"
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as f:
+        return f.read()
+
+class StubHandler(BaseHTTPRequestHandler):
+    # Replays the saved Vinted pages and CeX boxes, and answers OpenAI chat completions.
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/catalog":
+            self._send(200, "text/html", self.server.search_html)
+        elif url.path.startswith("/items/"):
+            self._send_item(url.path)
+        elif url.path == "/v3/boxes":
+            time.sleep(self.server.cex_latency)
+            query = parse_qs(url.query).get("q", [""])[0]
+            self._send(200, "application/json", json.dumps(self.server.search_boxes(query)))
+        elif url.path.startswith("/t/"):
+            self._send(200, "image/webp", b"\0" * self.server.image_bytes)
+        else:
+            self._send(404, "text/plain", "Not found")
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path.rstrip("/").endswith("/chat/completions"):
+            time.sleep(self.server.llm_latency)
+            self._send(200, "application/json", json.dumps(fake_completion(body)))
+        else:
+            self._send(404, "text/plain", "Not found")
+
+    def _send_item(self, path):
+        match = re.match(r"/items/(\d+)", path)
+        listing = self.server.listings.get(int(match.group(1))) if match else None
+        if listing is None:
+            self._send(404, "text/plain", "Not found")
+            return
+        html = self.server.item_html
+        html = html.replace("PS5 Hogwarts Legacy", listing["title"]).replace("12.00", f"{listing['price']:.2f}")
+        # A distinct description per listing keeps the LLM response cache from answering every query.
+        html = html.replace("Comes with case.", f"Comes with case. Listing {match.group(1)}.")
+        self._send(200, "text/html", html)
+
+    def _send(self, status, content_type, body):
+        data = body if isinstance(body, bytes) else body.encode("utf-8")
+        self.server.count_bytes(len(data))
+        self.send_response(status)
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8" if not isinstance(body, bytes) else content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, llm_latency, cex_latency, image_bytes):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.llm_latency = llm_latency
+        self.cex_latency = cex_latency
+        self.image_bytes = image_bytes
+        self.bytes_sent = 0
+        self._bytes_lock = threading.Lock()
+        self.base_url = f"http://127.0.0.1:{self.server_address[1]}"
+
+        search_html = read_fixture("vinted_search.html")
+        item_html = read_fixture("vinted_item.html")
+        for host in LIVE_HOSTS:
+            search_html = search_html.replace(host, self.base_url)
+            item_html = item_html.replace(host, self.base_url)
+        self.search_html = search_html
+        self.item_html = item_html
+
+        self.listings = {}
+        for item_id, title, price in re.findall(r'/items/(\d+)-[^"]*" title="([^,]+),.*?£(\d+\.\d+)', search_html):
+            self.listings[int(item_id)] = {"title": title.replace("&#39;", "'"), "price": float(price)}
+        with open(os.path.join(FIXTURES_DIR, "cex_catalogue.jsonl"), encoding="utf-8") as f:
+            self.boxes = [json.loads(line) for line in f if line.strip()]
+
+    def count_bytes(self, count):
+        with self._bytes_lock:
+            self.bytes_sent += count
+
+    def reset_bytes(self):
+        with self._bytes_lock:
+            sent, self.bytes_sent = self.bytes_sent, 0
+        return sent
+
+    def search_boxes(self, query):
+        words = set(re.findall(r"[a-z0-9]+", query.lower()))
+        ranked = []
+        for box in self.boxes:
+            box_words = set(re.findall(r"[a-z0-9]+", f"{box['boxName']} {box['categoryFriendlyName']}".lower()))
+            overlap = len(words & box_words)
+            if words and overlap * 2 >= len(words):
+                ranked.append((overlap, box))
+        ranked.sort(key=lambda pair: pair[0], reverse=True)
+        boxes = [box for _, box in ranked[:5]]
+        return {"response": {"data": {"boxes": boxes, "totalRecords": len(boxes)} if boxes else None}}
+
+def fake_completion(body):
+    prompt = body["messages"][-1]["content"]
+    titles = re.findall(r'Vinted Title: "(.*)"', prompt)
+    if "CeX Search Results" in prompt:
+        # Match selection: pick the first CeX result, as a confident model would.
+        links = re.findall(r"Link: (\S+)", prompt)
+        content = links[0] if links else "N/A"
+    elif body.get("response_format", {}).get("type") == "json_object":
+        content = json.dumps({"queries": titles})
+    else:
+        content = titles[0] if titles else "N/A"
+    return {
+        "id": "chatcmpl-bench",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "bench"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4, "total_tokens": (len(prompt) + len(content)) // 4},
+    }
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[int(round(fraction * (len(ordered) - 1)))], 4)
+
+def latency_summary(values):
+    return {"count": len(values), "p50": percentile(values, 0.5), "p95": percentile(values, 0.95)}
+
+class RssSampler:
+    # Peak resident memory of this process and its children (the Chrome and chromedriver processes).
+    def __init__(self, interval=0.2):
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_mb = max(self.peak_mb, self.sample_mb())
+            self._stop.wait(self.interval)
+
+    def sample_mb(self):
+        if psutil is None:
+            import resource
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        process = psutil.Process()
+        total = 0
+        for p in [process] + process.children(recursive=True):
+            try:
+                total += p.memory_info().rss
+            except psutil.Error:
+                pass
+        return total / (1024 * 1024)
+
+def run_scenario(workers, search_repeats, lean):
+    # Imported here so the environment set up by run_scenario_subprocess is in place before config loads.
+    import config
+    from scraper import (
+        scrape_vinted_search_page, process_item, get_cex_buy_price, get_cex_buy_price_api, lookup_cex_buy_price,
+        get_cex_cache, normalise_query,
+    )
+    from utils import DriverPool, cleanup_drivers
+    from cex_api import close_http_client
+    from cache import close_caches
+    from llm import close_openai_client
+    from seen_index import close_seen_index
+    from result_store import close_result_store
+
+    # The stub never rate limits, so the limiters should not be what is measured.
+    for host in config.RATE_LIMITS:
+        config.RATE_LIMITS[host] = {"rate": 1000.0, "min_rate": 1000.0, "max_rate": 1000.0, "max_concurrency": 1000}
+
+    config.LEAN_BROWSER = lean
+    result = {"workers": workers, "mode": "lean" if lean else "full"}
+    pool = DriverPool(workers)
+    try:
+        with RssSampler() as sampler:
+            search_latencies = []
+            items = []
+            with pool.lease() as driver:
+                for _ in range(search_repeats):
+                    start = time.perf_counter()
+                    items = scrape_vinted_search_page(driver, BENCH_TERM, num_items_to_check=20)
+                    search_latencies.append(time.perf_counter() - start)
+            result["scrape_vinted_search_page"] = dict(latency_summary(search_latencies), items=len(items))
+
+            def timed_process_item(item):
+                start = time.perf_counter()
+                pool.run(process_item, item, BENCH_TERM)
+                return time.perf_counter() - start
+
+            start = time.perf_counter()
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+                item_latencies = list(executor.map(timed_process_item, items))
+            elapsed = time.perf_counter() - start
+            stages = {}
+            for item in items:
+                for stage, seconds in item.get('timings', {}).items():
+                    stages.setdefault(stage, []).append(seconds)
+            result["process_item"] = dict(
+                latency_summary(item_latencies),
+                seconds=round(elapsed, 3),
+                items_per_second=round(len(items) / elapsed, 3) if elapsed else None,
+                verdicts={verdict: sum(1 for item in items if item.get('verdict') == verdict) for verdict in {item.get('verdict') for item in items}},
+                stages={stage: latency_summary(seconds) for stage, seconds in stages.items()},
+            )
+
+            # The queries process_item looked up, so the cache keys are the ones a run uses.
+            queries = sorted({item['clean_query'] for item in items if item.get('clean_query') and item['clean_query'].upper() != 'N/A'})
+            uncached = measure_cex(workers, queries, lambda query: get_cex_buy_price_api(query, {"title": query}, []))
+            # Warm the persistent cache and the single-flight memo for every query before timing them
+            # separately: lookup_cex_buy_price reads the cache without the memo in front of it. Queries
+            # without a CeX match are never cached, so they are left out.
+            for query in queries:
+                lookup_cex_buy_price(None, query, {"title": query}, [])
+                get_cex_buy_price(None, query, {"title": query}, [])
+            cached_queries = [query for query in queries if get_cex_cache().get(f"query:{normalise_query(query)}")]
+            result["get_cex_buy_price"] = {
+                "uncached": uncached,
+                "disk_cache": measure_cex(workers, cached_queries, lambda query: lookup_cex_buy_price(None, query, {"title": query}, [])),
+                "memo": measure_cex(workers, cached_queries, lambda query: get_cex_buy_price(None, query, {"title": query}, [])),
+            }
+        result["peak_rss_mb"] = round(sampler.peak_mb, 1)
+        result["driver_pool"] = pool.stats()
+    finally:
+        pool.close()
+        cleanup_drivers()
+        close_http_client()
+        close_openai_client()
+        close_caches()
+        close_seen_index()
+        close_result_store()
+    return result
+
+def measure_cex(workers, queries, lookup):
+    def timed(query):
+        start = time.perf_counter()
+        lookup(query)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        latencies = list(executor.map(timed, queries))
+    elapsed = time.perf_counter() - start
+    return dict(latency_summary(latencies), lookups_per_second=round(len(queries) / elapsed, 3) if elapsed else None)
+
+def run_scenario_subprocess(workers, lean, args, base_url):
+    # Each worker count runs in a fresh process with empty caches and seen index, so RSS and
+    # cache state from one scenario do not leak into the next.
+    with tempfile.TemporaryDirectory(prefix="vinted-bench-") as workdir:
+        env = dict(
+            os.environ,
+            CACHE_DIR=os.path.join(workdir, "cache"),
+            RESULTS_JSONL_PATH=os.path.join(workdir, "results.jsonl"),
+            DEBUG_CAPTURE_DIR=os.path.join(workdir, "debug_pages"),
+            VINTED_BASE_URL=base_url,
+            CEX_API_URL=f"{base_url}/v3/boxes",
+            CEX_BACKEND="api",
+            OPENAI_BASE_URL=f"{base_url}/v1",
+            OPENAI_API_KEY="benchmark",
+        )
+        output = os.path.join(workdir, "scenario.json")
+        command = [sys.executable, os.path.abspath(__file__), "--scenario", str(workers), "--scenario-output", output,
+                   "--search-repeats", str(args.search_repeats)] + (["--lean"] if lean else [])
+        completed = subprocess.run(command, env=env, stdout=subprocess.DEVNULL if not args.verbose else None)
+        if completed.returncode != 0:
+            return {"workers": workers, "mode": "lean" if lean else "full", "error": f"scenario exited with status {completed.returncode}"}
+        with open(output, encoding="utf-8") as f:
+            return json.load(f)
+
+def lean_savings(scenarios):
+    by_mode = {(scenario["mode"], scenario["workers"]): scenario for scenario in scenarios if "error" not in scenario}
+    savings = []
+    for (mode, workers), full in sorted(by_mode.items()):
+        lean = by_mode.get(("lean", workers))
+        if mode != "full" or lean is None:
+            continue
+        full_rss, lean_rss = full["driver_pool"]["peak_rss_mb"], lean["driver_pool"]["peak_rss_mb"]
+        savings.append({
+            "workers": workers,
+            "bytes_saved_pct": round(100 * (1 - lean["stub_bytes_served"] / full["stub_bytes_served"]), 1) if full["stub_bytes_served"] else None,
+            "driver_rss_saved_mb": round(full_rss - lean_rss, 1),
+            "peak_rss_saved_mb": round(full["peak_rss_mb"] - lean["peak_rss_mb"], 1),
+        })
+    return savings
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the item pipeline against recorded Vinted, CeX and OpenAI responses.")
+    parser.add_argument("--workers", default="1,2,4", help="Comma-separated worker counts to run.")
+    parser.add_argument("--modes", default="full", help="Comma-separated browser modes to run: full, lean.")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="Seconds the fake OpenAI endpoint waits per request.")
+    parser.add_argument("--cex-latency", type=float, default=0.05, help="Seconds the stub CeX API waits per request.")
+    parser.add_argument("--image-bytes", type=int, default=20000, help="Size of each stub listing image.")
+    parser.add_argument("--search-repeats", type=int, default=3, help="Search page loads to time per scenario.")
+    parser.add_argument("--output", default="benchmark_results.json", help="Machine-readable results file.")
+    parser.add_argument("--verbose", action="store_true", help="Show the scraper's own output.")
+    parser.add_argument("--scenario", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--lean", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--scenario-output", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    if args.scenario is not None:
+        result = run_scenario(args.scenario, args.search_repeats, args.lean)
+        with open(args.scenario_output, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        return
+
+    server = StubServer(args.llm_latency, args.cex_latency, args.image_bytes)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Stub server listening on {server.base_url}")
+
+    report = {
+        "commit": git_commit(),
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "settings": {
+            "llm_latency": args.llm_latency,
+            "cex_latency": args.cex_latency,
+            "image_bytes": args.image_bytes,
+            "search_repeats": args.search_repeats,
+        },
+        "scenarios": [],
+    }
+    try:
+        for mode in args.modes.split(","):
+            for workers in [int(count) for count in args.workers.split(",")]:
+                print(f"--- {workers} worker(s), {mode} browser ---")
+                server.reset_bytes()
+                scenario = run_scenario_subprocess(workers, mode == "lean", args, server.base_url)
+                scenario["stub_bytes_served"] = server.reset_bytes()
+                report["scenarios"].append(scenario)
+                if "error" in scenario:
+                    print(f"!! {scenario['error']}")
+                    continue
+                process = scenario["process_item"]
+                print(
+                    f"process_item: {process['items_per_second']} items/s, p50 {process['p50']}s, p95 {process['p95']}s; "
+                    f"search p50 {scenario['scrape_vinted_search_page']['p50']}s; "
+                    f"CeX p50 {scenario['get_cex_buy_price']['uncached']['p50']}s uncached, "
+                    f"{scenario['get_cex_buy_price']['disk_cache']['p50']}s from the cache; "
+                    f"peak RSS {scenario['peak_rss_mb']} MB, {scenario['stub_bytes_served'] / 1024:.0f} KB served"
+                )
+    finally:
+        server.shutdown()
+
+    report["lean_savings"] = lean_savings(report["scenarios"])
+    for saving in report["lean_savings"]:
+        print(
+            f"Lean mode with {saving['workers']} worker(s): {saving['bytes_saved_pct']}% less bandwidth, "
+            f"{saving['driver_rss_saved_mb']} MB less peak RSS per driver, {saving['peak_rss_saved_mb']} MB less in total"
+        )
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote benchmark results to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import threading
+import httpx
+import config
+from rate_limit import get_limiter
+import metrics
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_http_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = httpx.Client(
+                    timeout=config.CEX_API_TIMEOUT,
+                    limits=httpx.Limits(
+                        max_connections=config.CEX_API_MAX_CONNECTIONS,
+                        max_keepalive_connections=config.CEX_API_MAX_CONNECTIONS,
+                    ),
+                    headers={
+                        "Accept": "application/json",
+                        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/108.0.0.0 Safari/537.36",
+                    },
+                )
+    return _client
+
+def close_http_client():
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+def fetch_boxes(params, first_record=1, count=50):
+    with get_limiter("webuy.com").slot() as slot, metrics.timer("cex_request_seconds", backend="api"):
+        response = get_http_client().get(
+            config.CEX_API_URL,
+            params=dict(params, firstRecord=first_record, count=count),
+        )
+        if response.status_code == 429:
+            slot.rate_limited()
+        response.raise_for_status()
+
+    # The boxes API returns "data": null rather than an empty list when nothing matches.
+    data = (response.json().get('response') or {}).get('data') or {}
+    return data.get('boxes') or [], data.get('totalRecords') or 0
+
+def box_to_result(box):
+    box_id = box.get('boxId')
+    title = box.get('boxName')
+    cash_price = box.get('cashPrice')
+    if not box_id or not title or cash_price is None:
+        return None
+    return {
+        "title": title,
+        "link": config.CEX_SELL_PRODUCT_URL.format(box_id=box_id),
+        "price": float(cash_price),
+        "category": box.get('categoryFriendlyName') or box.get('categoryName') or "",
+    }
+
+def search_boxes(query, count=5):
+    boxes, _ = fetch_boxes({"q": query}, count=count)
+    results = [result for result in map(box_to_result, boxes) if result]
+    return results[:count]
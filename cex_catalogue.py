@@ -0,0 +1,209 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+import httpx
+import config
+from cex_api import fetch_boxes, box_to_result, close_http_client
+from matcher import describe
+
+_catalogue = None
+_catalogue_lock = threading.Lock()
+
+def box_tokens(name, category):
+    info = describe(f"{name} {category}")
+    tokens = set(info["tokens"])
+    if info["platform"]:
+        tokens.add(f"platform:{info['platform']}")
+    return tokens
+
+class CexCatalogue:
+    # SQLite is the store; lookups are served from the boxes and token index loaded into memory at start-up.
+    # A full catalogue (CEX_CATALOGUE_MAX_RECORDS_PER_QUERY boxes for each query, 35,000 in all) takes
+    # about 50-65 MB of RSS and half a second to load.
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS boxes ("
+            "box_id TEXT PRIMARY KEY, name TEXT NOT NULL, category TEXT, "
+            "cash_price REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS tokens (token TEXT NOT NULL, box_id TEXT NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS tokens_box_id ON tokens (box_id)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS sync_state (source TEXT PRIMARY KEY, synced_at REAL NOT NULL)")
+        self._conn.commit()
+
+        self.boxes = {}
+        self.index = defaultdict(set)
+        self._load()
+
+    def _load(self):
+        for box_id, name, category, cash_price in self._conn.execute("SELECT box_id, name, category, cash_price FROM boxes"):
+            self.boxes[box_id] = (name, category or "", cash_price)
+        for token, box_id in self._conn.execute("SELECT token, box_id FROM tokens"):
+            self.index[token].add(box_id)
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def upsert(self, raw_boxes):
+        changed = 0
+        now = time.time()
+        for box in raw_boxes:
+            result = box_to_result(box)
+            if result is None:
+                continue
+            box_id = str(box['boxId'])
+            row = (result['title'], result['category'], result['price'])
+            if self.boxes.get(box_id) == row:
+                continue
+
+            old = self.boxes.get(box_id)
+            if old is not None:
+                for token in box_tokens(old[0], old[1]):
+                    self.index[token].discard(box_id)
+                self._conn.execute("DELETE FROM tokens WHERE box_id = ?", (box_id,))
+
+            tokens = box_tokens(result['title'], result['category'])
+            self._conn.execute(
+                "INSERT OR REPLACE INTO boxes (box_id, name, category, cash_price, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (box_id, result['title'], result['category'], result['price'], now),
+            )
+            self._conn.executemany("INSERT INTO tokens (token, box_id) VALUES (?, ?)", [(token, box_id) for token in tokens])
+            self.boxes[box_id] = row
+            for token in tokens:
+                self.index[token].add(box_id)
+            changed += 1
+        self._conn.commit()
+        return changed
+
+    def sync(self, force=False):
+        # Returns the sources that failed. Their pages fetched so far are kept, and they are retried next sync.
+        now = time.time()
+        synced_at = dict(self._conn.execute("SELECT source, synced_at FROM sync_state"))
+        failed = []
+        for source in config.CEX_CATALOGUE_QUERIES:
+            if not force and now - synced_at.get(source, 0) < config.CEX_CATALOGUE_REFRESH_SECONDS:
+                print(f"-> '{source}' is up to date, skipping.")
+                continue
+
+            fetched = changed = 0
+            first_record = 1
+            try:
+                while first_record <= config.CEX_CATALOGUE_MAX_RECORDS_PER_QUERY:
+                    boxes, total = fetch_boxes({"q": source}, first_record, config.CEX_CATALOGUE_PAGE_SIZE)
+                    if not boxes:
+                        break
+                    fetched += len(boxes)
+                    changed += self.upsert(boxes)
+                    first_record += len(boxes)
+                    if first_record > total:
+                        break
+            except (httpx.HTTPError, ValueError) as e:
+                print(f"!! '{source}': CeX request failed ({type(e).__name__}) after {fetched} boxes, {changed} new or changed.")
+                failed.append(source)
+                continue
+
+            self._conn.execute("INSERT OR REPLACE INTO sync_state (source, synced_at) VALUES (?, ?)", (source, time.time()))
+            self._conn.commit()
+            print(f"-> '{source}': {fetched} boxes fetched, {changed} new or changed.")
+        return failed
+
+    def lookup(self, query, limit=5):
+        info = describe(query)
+        tokens = set(info["tokens"])
+        if not tokens:
+            return []
+
+        matches = defaultdict(int)
+        for token in tokens:
+            for box_id in self.index.get(token, ()):
+                matches[box_id] += 1
+        if info["platform"]:
+            platform_ids = self.index.get(f"platform:{info['platform']}", set())
+            matches = {box_id: count for box_id, count in matches.items() if box_id in platform_ids}
+
+        # At least half of the query's core tokens must appear in the box name.
+        required = (len(tokens) + 1) // 2
+        ranked = sorted(
+            (box_id for box_id, count in matches.items() if count >= required),
+            key=lambda box_id: (-matches[box_id], len(self.boxes[box_id][0])),
+        )
+        results = []
+        for box_id in ranked[:limit]:
+            name, category, cash_price = self.boxes[box_id]
+            results.append({
+                "title": name,
+                "link": config.CEX_SELL_PRODUCT_URL.format(box_id=box_id),
+                "price": cash_price,
+                "category": category,
+            })
+        return results
+
+    def import_jsonl(self, path):
+        with open(path, encoding="utf-8") as f:
+            return self.upsert(json.loads(line) for line in f if line.strip())
+
+    def export_jsonl(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for box_id, (name, category, cash_price) in sorted(self.boxes.items()):
+                f.write(json.dumps({"boxId": box_id, "boxName": name, "categoryFriendlyName": category, "cashPrice": cash_price}) + "\n")
+        return len(self.boxes)
+
+    def close(self):
+        self._conn.close()
+
+def get_catalogue():
+    global _catalogue
+    if not config.CEX_CATALOGUE_ENABLED or not os.path.exists(config.CEX_CATALOGUE_PATH):
+        return None
+    with _catalogue_lock:
+        if _catalogue is None:
+            _catalogue = CexCatalogue(config.CEX_CATALOGUE_PATH)
+    return _catalogue if len(_catalogue) else None
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the local CeX catalogue snapshot.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    sync_parser = subparsers.add_parser("sync", help="Pull boxes for CEX_CATALOGUE_QUERIES from the CeX API.")
+    sync_parser.add_argument("--force", action="store_true", help="Refresh every query, even if recently synced.")
+    import_parser = subparsers.add_parser("import", help="Load boxes from a JSONL snapshot, e.g. fixtures/cex_catalogue.jsonl.")
+    import_parser.add_argument("path")
+    export_parser = subparsers.add_parser("export", help="Write the catalogue to a JSONL snapshot.")
+    export_parser.add_argument("path")
+    lookup_parser = subparsers.add_parser("lookup", help="Show the catalogue candidates for a query.")
+    lookup_parser.add_argument("query")
+    args = parser.parse_args()
+
+    catalogue = CexCatalogue(config.CEX_CATALOGUE_PATH)
+    try:
+        if args.command == "sync":
+            failed = catalogue.sync(force=args.force)
+            if failed:
+                print(f"{len(failed)} sources could not be synced; live CeX lookups cover listings they would have matched.")
+        elif args.command == "import":
+            print(f"Imported {catalogue.import_jsonl(args.path)} new or changed boxes.")
+        elif args.command == "export":
+            print(f"Exported {catalogue.export_jsonl(args.path)} boxes to {args.path}")
+        else:
+            start = time.perf_counter()
+            results = catalogue.lookup(args.query)
+            elapsed_us = (time.perf_counter() - start) * 1e6
+            for result in results:
+                print(f"£{result['price']:.2f}  {result['title']} ({result['category']})  {result['link']}")
+            print(f"{len(results)} results in {elapsed_us:.0f} µs")
+        print(f"Catalogue holds {len(catalogue)} boxes.")
+    finally:
+        catalogue.close()
+        close_http_client()
+
+if __name__ == "__main__":
+    main()
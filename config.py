@@ -2,12 +2,21 @@ import os
 
 CHROME_PROFILE_PATH = os.path.expanduser('~/chrome-profile-for-script')
 
+# Rendered on demand from the result store with `python result_store.py report`.
 PROFIT_LOG_FILE = "potential_profits_log.txt"
 
+# Upper bound on browsers, each a Chrome process; the per-host limiters in RATE_LIMITS decide how many
+# are busy at once. Raise it on machines with memory to spare.
 MAX_WORKERS = 2
 
 ITEMS_TO_CHECK_PER_TERM = 200
 
+# Set VINTED_BASE_URL to point searches at a local stub server (see benchmark.py).
+VINTED_BASE_URL = os.getenv("VINTED_BASE_URL", "https://www.vinted.co.uk")
+
+# How long to wait for new grid items after scrolling before treating the search as exhausted.
+SEARCH_SCROLL_TIMEOUT = 5
+
 SEARCH_TERMS = [
     "PS5 games",
     "Xbox Series X games",
@@ -19,3 +28,217 @@ SEARCH_TERMS = [
     "PS4 Controller",
     "Nintendo Switch Controller"
 ]
+
+# "api" queries the CeX boxes endpoint over HTTP, "selenium" drives the sell pages in Chrome.
+# The API backend falls back to Selenium if the request fails.
+CEX_BACKEND = os.getenv("CEX_BACKEND", "api")
+
+CEX_API_URL = os.getenv("CEX_API_URL", "https://wss2.cex.uk.webuy.io/v3/boxes")
+
+CEX_SELL_PRODUCT_URL = "https://uk.webuy.com/sell/product-detail?id={box_id}"
+
+CEX_API_TIMEOUT = 10
+
+CEX_API_MAX_CONNECTIONS = 10
+
+CACHE_DIR = os.getenv("CACHE_DIR", ".cache")
+
+CEX_CACHE_PATH = os.path.join(CACHE_DIR, "cex_prices.sqlite")
+
+CEX_CACHE_TTL_SECONDS = 24 * 60 * 60
+
+CEX_CACHE_MAX_ENTRIES = 20000
+
+OPENAI_MODEL = "gpt-4o-mini"
+
+# Set OPENAI_BASE_URL to send chat completions to a compatible or fake endpoint.
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+
+OPENAI_TIMEOUT = 60
+
+OPENAI_MAX_CONNECTIONS = 10
+
+LLM_CACHE_PATH = os.path.join(CACHE_DIR, "llm_responses.sqlite")
+
+LLM_CACHE_TTL_SECONDS = 30 * 24 * 60 * 60
+
+LLM_CACHE_MAX_ENTRIES = 50000
+
+# Results shared between identical lookups within a process expire with the matching cache TTL, and
+# only this many of the most recently used are kept per lookup type.
+SINGLEFLIGHT_MEMO_MAX_ENTRIES = 5000
+
+# Number of listings normalised per chat completion. 1 keeps the original one-request-per-item flow.
+LLM_BATCH_SIZE = 20
+
+# Vinted item IDs with their last-seen price and verdict, carried between runs to skip unchanged listings.
+SEEN_INDEX_PATH = os.path.join(CACHE_DIR, "seen_listings.sqlite")
+
+# Staged pipeline (python main.py --pipeline). Item fetches use MAX_WORKERS browsers.
+PIPELINE_QUEUE_SIZE = 50
+
+PIPELINE_SEARCH_CONCURRENCY = 2
+
+PIPELINE_LLM_CONCURRENCY = 4
+
+PIPELINE_CEX_CONCURRENCY = 8
+
+PIPELINE_BATCH_WAIT_SECONDS = 5
+
+# Pooled drivers are replaced after this many checkouts, or when Chrome's RSS exceeds the limit (needs psutil).
+DRIVER_MAX_PAGES = 50
+
+DRIVER_MAX_RSS_MB = 1500
+
+# Lean browsers skip the requests listed in LEAN_BLOCKED_URL_PATTERNS (via the DevTools protocol), return
+# from page loads at DOMContentLoaded and render into a smaller window. Enable with LEAN_BROWSER=1 or --lean.
+LEAN_BROWSER = os.getenv("LEAN_BROWSER") == "1"
+
+LEAN_WINDOW_SIZE = "1280,800"
+
+LEAN_BLOCKED_URL_PATTERNS = [
+    # Images and fonts: only text, meta tags and attributes are read.
+    "*.jpg", "*.jpeg", "*.png", "*.gif", "*.webp", "*.avif", "*.svg", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf",
+    "*images1.vinted.net*", "*marketplace-web-assets.vinted.com*/fonts/*",
+    # Analytics, advertising and tag managers.
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*", "*googlesyndication.com*",
+    "*facebook.net*", "*connect.facebook.com*", "*hotjar.com*", "*criteo.com*", "*criteo.net*",
+    "*bing.com/bat*", "*tiktok.com*", "*snapchat.com*", "*pinterest.com*", "*datadoghq*", "*sentry.io*",
+]
+
+# With TABS_PER_BROWSER above 1, the batched fetch stage loads listings in TAB_BROWSERS browsers with that
+# many tabs each, interleaving page loads instead of giving every worker its own browser.
+TABS_PER_BROWSER = int(os.getenv("TABS_PER_BROWSER", "1"))
+
+TAB_BROWSERS = 2
+
+TAB_PAGE_TIMEOUT = 20
+
+TAB_POLL_INTERVAL = 0.05
+
+# Per-host adaptive limits: the request rate (req/s) and concurrency ramp up while responses are healthy
+# and are cut by RATE_LIMIT_BACKOFF, with a cooldown, on a rate-limit page or HTTP 429.
+RATE_LIMITS = {
+    "vinted.co.uk": {"rate": 0.5, "min_rate": 0.05, "max_rate": 4.0, "max_concurrency": 8},
+    "webuy.com": {"rate": 2.0, "min_rate": 0.1, "max_rate": 10.0, "max_concurrency": 16},
+    "openai": {"rate": 5.0, "min_rate": 0.5, "max_rate": 50.0, "max_concurrency": 16},
+}
+
+RATE_LIMIT_BACKOFF = 0.5
+
+RATE_LIMIT_COOLDOWN_SECONDS = 10
+
+RATE_LIMIT_MAX_REQUEUES = 3
+
+# Local CeX match scores are 0-1. Confident matches skip the LLM, hopeless ones are rejected, the rest go to the LLM.
+MATCH_ACCEPT_SCORE = 0.75
+
+MATCH_MIN_MARGIN = 0.1
+
+MATCH_REJECT_SCORE = 0.2
+
+# Share of locally accepted matches also sent to the LLM to measure agreement.
+MATCH_AUDIT_RATE = 0.05
+
+# Listings are skipped before any page, LLM or CeX work once their search price plus the cheapest postage
+# and the buyer protection fee exceed the best CeX cash price seen for the term, times the headroom.
+# Because results are sorted by price, the rest of the term is skipped too.
+PRICE_BOUND_ENABLED = True
+
+PRICE_BOUND_HEADROOM = 1.25
+
+PRICE_BOUND_MIN_POSTAGE = 1.99
+
+# Terms with fewer historic CeX matches than this are never pruned.
+PRICE_BOUND_MIN_SAMPLES = 10
+
+# Local snapshot of CeX boxes, refreshed with `python cex_catalogue.py sync`. When present it is consulted
+# before any live CeX request.
+CEX_CATALOGUE_ENABLED = True
+
+CEX_CATALOGUE_PATH = os.path.join(CACHE_DIR, "cex_catalogue.sqlite")
+
+CEX_CATALOGUE_QUERIES = [
+    "PS5",
+    "PS4",
+    "Xbox Series X",
+    "Xbox One",
+    "Nintendo Switch",
+    "Switch Lite",
+    "Controller",
+]
+
+CEX_CATALOGUE_PAGE_SIZE = 50
+
+CEX_CATALOGUE_MAX_RECORDS_PER_QUERY = 5000
+
+CEX_CATALOGUE_REFRESH_SECONDS = 24 * 60 * 60
+
+# Every evaluated listing is appended here, and to the SQLite table too if RESULTS_SQLITE_PATH is set.
+RESULTS_JSONL_PATH = os.getenv("RESULTS_JSONL_PATH", "results.jsonl")
+
+RESULTS_SQLITE_PATH = os.getenv("RESULTS_SQLITE_PATH")
+
+RESULT_STORE_BATCH_SIZE = 50
+
+RESULT_STORE_FLUSH_SECONDS = 1
+
+# Written at the end of every run; set either to an empty string to skip it.
+METRICS_PROMETHEUS_PATH = os.getenv("METRICS_PROMETHEUS_PATH", "metrics.prom")
+
+METRICS_JSON_PATH = os.getenv("METRICS_JSON_PATH", "metrics.json")
+
+# Sharded runs (`main.py --shard-index/--shard-count` or `--processes`) write their partial results here.
+SHARD_OUTPUT_DIR = os.getenv("SHARD_OUTPUT_DIR", "shards")
+
+# Watch mode (`main.py --watch`) polls each term's newest listings every WATCH_INTERVAL_SECONDS.
+WATCH_INTERVAL_SECONDS = 60
+
+WATCH_MAX_ITEMS_PER_POLL = 48
+
+# Bumped and promoted listings can appear among new ones, so a poll only stops after this many
+# listings in a row at or below the high-water mark.
+WATCH_OLD_LISTINGS_BEFORE_STOP = 5
+
+# On the first poll of a term, process the current listings (True) or only set the high-water mark.
+WATCH_BACKFILL = False
+
+# Profitable listings are also posted here as JSON ({"text": ..., "content": ...}), e.g. a Slack or Discord webhook.
+WATCH_WEBHOOK_URL = os.getenv("WATCH_WEBHOOK_URL")
+
+# Every run checkpoints each listing's progress here, so `main.py --resume` can continue after a crash.
+WORK_QUEUE_PATH = os.getenv("WORK_QUEUE_PATH", os.path.join(CACHE_DIR, "work_queue.sqlite"))
+
+# A listing leased by a run that stopped responding is picked up again after this long.
+WORK_QUEUE_LEASE_SECONDS = 600
+
+# Listings that failed this many runs are left out of later resumes.
+WORK_QUEUE_MAX_ATTEMPTS = 3
+
+# Vinted buyer protection: a fixed fee plus a share of the item price.
+BUYER_PROTECTION_FIXED_FEE = 0.70
+
+BUYER_PROTECTION_RATE = 0.05
+
+# Offline re-scoring (`python rescore.py`) of the seen index against the CeX catalogue's current prices.
+# The "listed" postage model uses each listing's postage (RESCORE_POSTAGE when unknown); "flat" charges RESCORE_POSTAGE for all.
+RESCORE_POSTAGE_MODEL = "listed"
+
+RESCORE_POSTAGE = 2.99
+
+# Opportunities must clear both: profit in pounds, and profit as a share of the total Vinted cost.
+RESCORE_MIN_PROFIT = 0.0
+
+RESCORE_MIN_MARGIN = 0.0
+
+RESCORE_TOP = 50
+
+# Pages that fail to parse are saved here gzipped, named by content hash, and the log only names the file.
+# A share of failures (DEBUG_CAPTURE_SAMPLE_RATE) is saved until the directory holds DEBUG_CAPTURE_MAX_BYTES.
+# Set the directory to an empty string to turn capture off.
+DEBUG_CAPTURE_DIR = os.getenv("DEBUG_CAPTURE_DIR", "debug_pages")
+
+DEBUG_CAPTURE_SAMPLE_RATE = 1.0
+
+DEBUG_CAPTURE_MAX_BYTES = 50 * 1024 * 1024
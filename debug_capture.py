@@ -0,0 +1,145 @@
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import random
+import shutil
+import threading
+import time
+import config
+
+_capture = None
+_capture_lock = threading.Lock()
+
+INDEX_FILE = "index.jsonl"
+
+class DebugCapture:
+    # Pages that failed to parse are gzipped to disk under their content hash, so a run's memory and
+    # log output stay the same size however many failures it hits. Identical pages are stored once.
+    def __init__(self, directory, sample_rate, max_bytes):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        self.stats = {"captured": 0, "duplicates": 0, "sampled_out": 0, "over_cap": 0}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.total_bytes = sum(
+            entry.stat().st_size for entry in os.scandir(directory) if entry.name.endswith(".html.gz")
+        )
+
+    def sampled(self):
+        # Decided before the page is read, so skipped failures never pull page_source out of Chrome.
+        if random.random() < self.sample_rate:
+            return True
+        with self._lock:
+            self.stats["sampled_out"] += 1
+        return False
+
+    def capture(self, kind, url, html):
+        # Returns the snapshot's path, or None when the size cap has been reached.
+        data = html.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()[:16]
+        path = os.path.join(self.directory, f"{kind}-{digest}.html.gz")
+        if os.path.exists(path):
+            with self._lock:
+                self.stats["duplicates"] += 1
+            return path
+
+        compressed = gzip.compress(data)
+        with self._lock:
+            if self.total_bytes + len(compressed) > self.max_bytes:
+                self.stats["over_cap"] += 1
+                return None
+            self.total_bytes += len(compressed)
+            self.stats["captured"] += 1
+            with open(path, "wb") as f:
+                f.write(compressed)
+            with open(os.path.join(self.directory, INDEX_FILE), "a", encoding="utf-8") as f:
+                f.write(json.dumps({
+                    "snapshot": os.path.basename(path),
+                    "kind": kind,
+                    "url": url,
+                    "captured_at": time.time(),
+                    "html_bytes": len(data),
+                    "compressed_bytes": len(compressed),
+                }) + "\n")
+        return path
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, total_bytes=self.total_bytes)
+
+def get_debug_capture():
+    global _capture
+    if not config.DEBUG_CAPTURE_DIR:
+        return None
+    with _capture_lock:
+        if _capture is None:
+            _capture = DebugCapture(config.DEBUG_CAPTURE_DIR, config.DEBUG_CAPTURE_SAMPLE_RATE, config.DEBUG_CAPTURE_MAX_BYTES)
+        return _capture
+
+def capture_html(kind, url, html):
+    capture = get_debug_capture()
+    if capture is None or not capture.sampled():
+        return None
+    return capture.capture(kind, url, html)
+
+def capture_page(driver, kind):
+    capture = get_debug_capture()
+    if capture is None or not capture.sampled():
+        return None
+    return capture.capture(kind, driver.current_url, driver.page_source)
+
+def debug_note(reference):
+    # What goes into the log instead of the page itself.
+    return f"Page saved to {reference}" if reference else "Page not saved (sampled out or over DEBUG_CAPTURE_MAX_BYTES)"
+
+def debug_capture_report():
+    with _capture_lock:
+        capture = _capture
+    if capture is None:
+        return None
+    stats = capture.snapshot()
+    return (
+        f"Debug pages: {stats['captured']} saved, {stats['duplicates']} already saved, {stats['sampled_out']} sampled out, "
+        f"{stats['over_cap']} over the size cap ({stats['total_bytes'] / 1024:.0f} KB in {capture.directory})"
+    )
+
+def read_snapshot(path):
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return f.read()
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect the pages saved when parsing failed.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("list", help="Show the saved pages, newest last.")
+    extract_parser = subparsers.add_parser("extract", help="Decompress a saved page, e.g. into fixtures/ for offline parser tests.")
+    extract_parser.add_argument("snapshot")
+    extract_parser.add_argument("output")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        # Sharded runs save to a subdirectory per shard.
+        entries = []
+        for directory, _, files in os.walk(config.DEBUG_CAPTURE_DIR):
+            if INDEX_FILE in files:
+                with open(os.path.join(directory, INDEX_FILE), encoding="utf-8") as f:
+                    for line in f:
+                        entry = json.loads(line)
+                        entry['snapshot'] = os.path.relpath(os.path.join(directory, entry['snapshot']), config.DEBUG_CAPTURE_DIR)
+                        entries.append(entry)
+        if not entries:
+            print(f"No pages saved in {config.DEBUG_CAPTURE_DIR}.")
+            return
+        for entry in sorted(entries, key=lambda entry: entry['captured_at']):
+            captured_at = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry['captured_at']))
+            print(f"{captured_at}  {entry['snapshot']}  {entry['html_bytes'] / 1024:.0f} KB  {entry['url']}")
+    else:
+        path = args.snapshot if os.path.exists(args.snapshot) else os.path.join(config.DEBUG_CAPTURE_DIR, args.snapshot)
+        with gzip.open(path, "rb") as source, open(args.output, "wb") as target:
+            shutil.copyfileobj(source, target)
+        print(f"Wrote {args.output}")
+
+if __name__ == "__main__":
+    main()
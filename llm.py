@@ -0,0 +1,88 @@
+import hashlib
+import json
+import os
+import threading
+import httpx
+from openai import OpenAI, RateLimitError
+from dotenv import load_dotenv
+import config
+from cache import get_cache
+from rate_limit import get_limiter
+from singleflight import get_flight
+import metrics
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_openai_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                load_dotenv()
+                api_key = os.getenv("OPENAI_API_KEY")
+                if not api_key:
+                    return None
+                http_client = httpx.Client(
+                    timeout=config.OPENAI_TIMEOUT,
+                    limits=httpx.Limits(
+                        max_connections=config.OPENAI_MAX_CONNECTIONS,
+                        max_keepalive_connections=config.OPENAI_MAX_CONNECTIONS,
+                    ),
+                )
+                _client = OpenAI(api_key=api_key, base_url=config.OPENAI_BASE_URL, http_client=http_client)
+    return _client
+
+def close_openai_client():
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+def get_llm_cache():
+    return get_cache(config.LLM_CACHE_PATH, config.LLM_CACHE_TTL_SECONDS, config.LLM_CACHE_MAX_ENTRIES)
+
+def prompt_cache_key(messages):
+    # The prompts embed the listing title, description, attributes and category (plus the CeX
+    # candidates for match selection), so hashing them addresses the response by its content.
+    payload = json.dumps({"model": config.OPENAI_MODEL, "messages": messages}, sort_keys=True)
+    return "chat:" + hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def get_cached_completion(messages):
+    return get_llm_cache().get(prompt_cache_key(messages))
+
+def store_completion(messages, content):
+    get_llm_cache().set(prompt_cache_key(messages), content)
+
+def chat_completion(client, messages, use_cache=True, **kwargs):
+    if not use_cache:
+        return request_completion(client, messages, **kwargs), False
+    # Identical prompts in flight at the same time, or repeated later in the run, share one answer.
+    (content, from_cache), shared = get_flight("LLM prompts", ttl=config.LLM_CACHE_TTL_SECONDS).do(
+        prompt_cache_key(messages), lambda: cached_completion(client, messages, **kwargs)
+    )
+    return content, from_cache or shared
+
+def cached_completion(client, messages, **kwargs):
+    cached = get_cached_completion(messages)
+    if cached is not None:
+        metrics.increment("openai_cache_hits_total")
+        return cached, True
+    content = request_completion(client, messages, **kwargs)
+    store_completion(messages, content)
+    return content, False
+
+def request_completion(client, messages, **kwargs):
+    with get_limiter("openai").slot() as slot, metrics.timer("openai_request_seconds"):
+        try:
+            response = client.chat.completions.create(
+                model=config.OPENAI_MODEL,
+                messages=messages,
+                temperature=0.0,
+                **kwargs
+            )
+        except RateLimitError:
+            slot.rate_limited()
+            raise
+    return response.choices[0].message.content.strip()
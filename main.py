@@ -1,50 +1,287 @@
+import argparse
 import concurrent.futures
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
+import itertools
+import os
+import subprocess
+import sys
+import time
 import config
-from scraper import scrape_vinted_search_page, process_item
-from utils import cleanup_drivers
+from scraper import (
+    iter_vinted_search_results,
+    iter_triaged_items,
+    iter_price_bounded_items,
+    prune_report,
+    process_item,
+    get_cex_cache,
+    fetch_item_for_batch,
+    evaluate_item_for_batch,
+    generate_cex_queries_batch,
+    reached,
+    checkpoint
+)
+from utils import cleanup_drivers, remove_stale_profiles, set_fallback_pool, DriverPool
+from cex_api import close_http_client
+from cache import close_caches
+from llm import close_openai_client, get_llm_cache
+from seen_index import close_seen_index
+from work_queue import get_work_queue, close_work_queue, progress_report
+from result_store import close_result_store
+from pipeline import run_pipeline
+from watch import run_watch
+from tabs import fetch_items_in_tabs
+from rate_limit import limiter_report
+from matcher import match_report
+from singleflight import singleflight_report
+from debug_capture import debug_capture_report
+from sharding import units_for_shard, iter_partition, shard_path, merge_results
+import metrics
 
-def main():
-    for term in config.SEARCH_TERMS:
-        search_page_driver = None
-        items_to_process = []
+def report_cache(label, cache):
+    stats = cache.stats()
+    print(f"{label}: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%} hit rate, {stats['entries']} entries)")
+
+def wait_for(futures):
+    for future in concurrent.futures.as_completed(futures):
         try:
-            print(f"\n--- Scraping Vinted for: '{term}' ---")
-            
-            service = Service()
-            options = Options()
-            options.add_argument("--headless")
-            options.add_argument("--log-level=3")
-            search_page_driver = webdriver.Chrome(service=service, options=options)
-            
-            items_to_process = scrape_vinted_search_page(search_page_driver, term, num_items_to_check=config.ITEMS_TO_CHECK_PER_TERM)
-            
-            if not items_to_process:
-                print("No items found to process. Moving to the next search term.")
-                continue
-
-            print(f"Found {len(items_to_process)} items to analyse. Starting parallel processing...")
-            
-        finally:
-            if search_page_driver:
-                search_page_driver.quit()
+            future.result()
+        except Exception as e:
+            print(f"A task in the thread pool generated an exception: {e}")
 
-        if items_to_process:
+def run_with_requeue(executor, task, items):
+    # items may be a generator: the first round submits each item as soon as it is produced.
+    submitted = []
+    results = {}
+    pending = items
+    for attempt in range(config.RATE_LIMIT_MAX_REQUEUES + 1):
+        futures = {}
+        for item in pending:
+            futures[executor.submit(task, item)] = item
+            if attempt == 0:
+                submitted.append(item)
+        for future in concurrent.futures.as_completed(futures):
             try:
-                with concurrent.futures.ThreadPoolExecutor(max_workers=config.MAX_WORKERS) as executor:
-                    futures = [executor.submit(process_item, item, term) for item in items_to_process]
-                    
-                    for future in concurrent.futures.as_completed(futures):
-                        try:
-                            future.result()
-                        except Exception as e:
-                            print(f"A task in the thread pool generated an exception: {e}")
-            finally:
-                print(f"\n--- Finished processing for '{term}' ---")
-                cleanup_drivers()
-                print("\n" + "="*50 + "\n")
+                results[id(futures[future])] = future.result()
+            except Exception as e:
+                print(f"A task in the thread pool generated an exception: {e}")
+
+        pending = [item for item in futures.values() if item.pop('rate_limited', False)]
+        if not pending:
+            break
+        if attempt < config.RATE_LIMIT_MAX_REQUEUES:
+            print(f"Requeueing {len(pending)} rate-limited items...")
+        else:
+            print(f"Dropping {len(pending)} items that stayed rate limited.")
+    return [(item, results.get(id(item))) for item in submitted]
+
+def process_items(executor, pool, items_to_process, term):
+    if config.LLM_BATCH_SIZE > 1:
+        return process_items_batched(executor, pool, items_to_process, term)
+    return bool(run_with_requeue(executor, lambda item: pool.run(process_item, item, term), items_to_process))
+
+def process_items_batched(executor, pool, items_to_process, term):
+    # Listings resumed from the work queue skip the stages they had already finished.
+    resumed_items = []
+
+    def iter_unfetched(items):
+        for item in items:
+            if reached(item, "fetched"):
+                resumed_items.append(item)
+            else:
+                yield item
+
+    if config.TABS_PER_BROWSER > 1:
+        fetched_items = fetch_items_in_tabs(pool, iter_unfetched(items_to_process))
+    else:
+        fetched = run_with_requeue(executor, lambda item: pool.run(fetch_item_for_batch, item), iter_unfetched(items_to_process))
+        fetched_items = [item for item, is_fetched in fetched if is_fetched]
+    fetched_items = resumed_items + fetched_items
+    if not fetched_items:
+        return False
+
+    unnormalised_items = [item for item in fetched_items if not reached(item, "normalised")]
+    if unnormalised_items:
+        log_messages = [f"Generating CeX queries for {len(unnormalised_items)} items in batches of {config.LLM_BATCH_SIZE}..."]
+        queries = generate_cex_queries_batch(unnormalised_items, term, log_messages)
+        print("\n".join(log_messages))
+        for item, query in zip(unnormalised_items, queries):
+            item['clean_query'] = query
+            checkpoint(item, "normalised")
+
+    if config.CEX_BACKEND == 'api':
+        wait_for([executor.submit(evaluate_item_for_batch, item, item['clean_query'], term) for item in fetched_items])
+    else:
+        wait_for([executor.submit(pool.run, evaluate_item_for_batch, item, item['clean_query'], term) for item in fetched_items])
+    return True
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Find Vinted listings that CeX will buy for more.")
+    parser.add_argument("--pipeline", action="store_true", help="Run the staged asyncio pipeline, overlapping search terms.")
+    parser.add_argument("--shard-index", type=int, default=int(os.getenv("SHARD_INDEX", "0")), help="Which shard of the search terms this run handles.")
+    parser.add_argument("--shard-count", type=int, default=int(os.getenv("SHARD_COUNT", "1")), help="How many shards the search terms are split into.")
+    parser.add_argument("--processes", type=int, default=1, help="Run this many shards as local processes, then merge their results.")
+    parser.add_argument("--lean", action="store_true", help="Start Chrome in lean mode (see LEAN_BROWSER in config.py).")
+    parser.add_argument("--watch", action="store_true", help="Keep polling the newest listings for each term and process only new ones.")
+    parser.add_argument("--watch-minutes", type=float, help="Stop watch mode after this many minutes (default: run until interrupted).")
+    parser.add_argument("--resume", action="store_true", help="Continue the last run from its checkpoints instead of starting from the first term.")
+    args = parser.parse_args()
+    if args.resume and (args.pipeline or args.watch):
+        parser.error("--resume continues the default run mode; it cannot be combined with --pipeline or --watch.")
+    return args
+
+def report_driver_pool(pool):
+    stats = pool.stats()
+    print(
+        f"Driver pool: {stats['created']} created, {stats['recycled']} recycled, {stats['unhealthy']} unhealthy, "
+        f"{stats['checkouts']} checkouts, peak RSS {stats['peak_rss_mb']:.0f} MB per driver"
+        + (" (lean mode)" if config.LEAN_BROWSER else "")
+    )
+
+def run_shard_processes(args):
+    start = time.time()
+    paths = [shard_path(config.RESULTS_JSONL_PATH, index, args.processes) for index in range(args.processes)]
+    if not args.resume:
+        # Shard files are removed once merged, so any left belong to a run that did not finish. Only
+        # --resume continues that run; otherwise they would be merged into this run's results.
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+    command = [sys.executable, os.path.abspath(__file__)] + (["--pipeline"] if args.pipeline else []) + (["--lean"] if args.lean else [])
+    command += ["--resume"] if args.resume else []
+    if args.watch:
+        command += ["--watch"] + (["--watch-minutes", str(args.watch_minutes)] if args.watch_minutes else [])
+    processes = [
+        subprocess.Popen(command + ["--shard-index", str(index), "--shard-count", str(args.processes)])
+        for index in range(args.processes)
+    ]
+    failed = [index for index, process in enumerate(processes) if process.wait() != 0]
+    if failed:
+        print(f"!! Shards {failed} exited with an error; merging the partial results that were written.")
+
+    paths = [path for path in paths if os.path.exists(path)]
+    total, unique = merge_results(paths, config.RESULTS_JSONL_PATH)
+    for path in paths:
+        os.remove(path)
+    print(f"Merged {total} shard results into {unique} listings, appended to {config.RESULTS_JSONL_PATH}")
+    print(f"{args.processes} shards finished in {time.time() - start:.0f}s")
+
+def report_bandwidth():
+    _, counters = metrics.snapshot()
+    mode = "lean" if config.LEAN_BROWSER else "full"
+    pages = counters.get(("vinted_pages_total", (("mode", mode),)), 0)
+    if pages:
+        page_bytes = counters.get(("vinted_page_bytes_total", (("mode", mode),)), 0)
+        print(f"Vinted pages: {pages} loaded, {page_bytes / pages / 1024:.0f} KB transferred per page ({mode} browser)")
+
+def main():
+    args = parse_args()
+    if args.lean:
+        config.LEAN_BROWSER = True
+    if args.processes > 1:
+        run_shard_processes(args)
+        return
+
+    units = units_for_shard(config.SEARCH_TERMS, args.shard_index, args.shard_count)
+    if args.shard_count > 1:
+        # Each shard writes its own partial results; `python sharding.py merge` combines them.
+        os.makedirs(config.SHARD_OUTPUT_DIR, exist_ok=True)
+        config.RESULTS_JSONL_PATH = shard_path(config.RESULTS_JSONL_PATH, args.shard_index, args.shard_count)
+        if config.METRICS_PROMETHEUS_PATH:
+            config.METRICS_PROMETHEUS_PATH = shard_path(config.METRICS_PROMETHEUS_PATH, args.shard_index, args.shard_count)
+        if config.METRICS_JSON_PATH:
+            config.METRICS_JSON_PATH = shard_path(config.METRICS_JSON_PATH, args.shard_index, args.shard_count)
+        if config.DEBUG_CAPTURE_DIR:
+            # Shards save debug pages to their own subdirectory, and share the size cap between them.
+            config.DEBUG_CAPTURE_DIR = os.path.join(config.DEBUG_CAPTURE_DIR, f"shard-{args.shard_index}-of-{args.shard_count}")
+            config.DEBUG_CAPTURE_MAX_BYTES //= args.shard_count
+        print(f"Shard {args.shard_index + 1} of {args.shard_count}: {len(units)} search units.")
+
+    removed = remove_stale_profiles()
+    if removed:
+        print(f"Removed {removed} Chrome profiles left behind by runs that did not exit cleanly.")
+    checkpointed = not (args.pipeline or args.watch)
+    if checkpointed:
+        work_queue = get_work_queue()
+        shard = f"{args.shard_index}/{args.shard_count}"
+        resume_units = work_queue.resume_units(shard) if args.resume else []
+        if resume_units:
+            units = resume_units
+            print(f"Resuming the last run. {progress_report(shard)}")
+        else:
+            if args.resume:
+                print("No checkpointed run to resume; starting from the first term.")
+            work_queue.start_run(units, shard)
+
+    if args.pipeline:
+        pool = DriverPool(config.MAX_WORKERS + config.PIPELINE_SEARCH_CONCURRENCY)
+    else:
+        pool = DriverPool(config.MAX_WORKERS + 1)
+    set_fallback_pool(pool)
+    try:
+        if args.watch:
+            run_watch(units, pool, args.watch_minutes * 60 if args.watch_minutes else None)
+        elif args.pipeline:
+            run_pipeline(units, pool)
+        else:
+            run_search_terms(pool, units, work_queue)
+    finally:
+        set_fallback_pool(None)
+        pool.close()
+        cleanup_drivers()
+        if checkpointed:
+            work_queue.release_leases()
+            print(progress_report(shard))
+        report_driver_pool(pool)
+        report_bandwidth()
+        for line in limiter_report():
+            print(f"Rate limiter {line}")
+        print(match_report())
+        print(prune_report())
+        for line in singleflight_report():
+            print(f"Duplicate lookups, {line}")
+        debug_report = debug_capture_report()
+        if debug_report:
+            print(debug_report)
+        print("\nRun metrics:")
+        for line in metrics.metrics_report():
+            print(f"  {line}")
+        metrics.write_exports()
+        report_cache("CeX price cache", get_cex_cache())
+        report_cache("LLM response cache", get_llm_cache())
+        close_http_client()
+        close_openai_client()
+        close_caches()
+        close_seen_index()
+        close_result_store()
+        close_work_queue()
+
+def run_search_terms(pool, units, work_queue):
+    for unit in units:
+        term, part, parts = unit
+        print(f"\n--- Scraping Vinted for: '{term}' ---" if parts == 1 else f"\n--- Scraping Vinted for: '{term}' (part {part + 1} of {parts}) ---")
+
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=config.MAX_WORKERS) as executor:
+                resumed_items = work_queue.lease_pending(unit)
+                if resumed_items:
+                    print(f"-> Resuming {len(resumed_items)} listings checkpointed by an earlier run.")
+                if work_queue.is_searched(unit):
+                    processed = process_items(executor, pool, resumed_items, term)
+                else:
+                    # The search driver stays leased while listings are streamed to the workers.
+                    with pool.lease() as search_page_driver:
+                        search_status = {}
+                        search_results = iter_vinted_search_results(
+                            search_page_driver, term, num_items_to_check=config.ITEMS_TO_CHECK_PER_TERM, status=search_status
+                        )
+                        listings = iter_partition(iter_price_bounded_items(search_results, term), part, parts)
+                        new_items = work_queue.iter_enqueued(iter_triaged_items(listings, term), unit, search_status)
+                        processed = process_items(executor, pool, itertools.chain(resumed_items, new_items), term)
+                if not processed:
+                    print("No items found to process. Moving to the next search term.")
+        finally:
+            print(f"\n--- Finished processing for '{term}' ---")
+            report_driver_pool(pool)
+            print("\n" + "="*50 + "\n")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,141 @@
+import random
+import re
+import threading
+from difflib import SequenceMatcher
+import config
+
+PLATFORM_PATTERNS = [
+    ("ps5", r"\b(ps5|playstation ?5|playstation5)\b"),
+    ("ps4", r"\b(ps4|playstation ?4|playstation4)\b"),
+    ("ps3", r"\b(ps3|playstation ?3|playstation3)\b"),
+    ("xbox series x", r"\b(xbox series x|series x|xsx)\b"),
+    ("xbox series s", r"\b(xbox series s|series s|xss)\b"),
+    ("xbox one", r"\b(xbox one|xb1|xbone)\b"),
+    ("xbox 360", r"\bxbox 360\b"),
+    ("switch", r"\b(nintendo switch|switch lite|switch oled|switch)\b"),
+    ("pc", r"\b(pc|windows)\b"),
+]
+
+EDITION_PATTERNS = [
+    ("day one", r"\bday (one|1)\b"),
+    ("deluxe", r"\bdeluxe\b"),
+    ("ultimate", r"\bultimate\b"),
+    ("gold", r"\bgold\b"),
+    ("collector", r"\bcollector'?s?\b"),
+    ("goty", r"\b(goty|game of the year)\b"),
+    ("definitive", r"\bdefinitive\b"),
+    ("complete", r"\bcomplete\b"),
+    ("limited", r"\blimited\b"),
+    ("launch", r"\blaunch\b"),
+]
+
+STOP_WORDS = {"the", "a", "an", "of", "and", "with", "for", "edition", "version", "no", "dlc", "game", "games", "new", "uk", "pal"}
+
+_stats = {"local_accept": 0, "local_reject": 0, "llm": 0, "compared": 0, "agreed": 0}
+_stats_lock = threading.Lock()
+
+def normalise_title(text):
+    text = (text or "").lower().replace("&", " and ")
+    text = re.sub(r"[^a-z0-9' ]", " ", text)
+    return " ".join(text.split())
+
+def extract_platform(text):
+    for platform, pattern in PLATFORM_PATTERNS:
+        if re.search(pattern, text):
+            return platform
+    return None
+
+def extract_editions(text):
+    return {edition for edition, pattern in EDITION_PATTERNS if re.search(pattern, text)}
+
+def core_tokens(text):
+    for _, pattern in PLATFORM_PATTERNS + EDITION_PATTERNS:
+        text = re.sub(pattern, " ", text)
+    return [token for token in text.replace("'", "").split() if token not in STOP_WORDS]
+
+def describe(text):
+    normalised = normalise_title(text)
+    return {
+        "text": normalised,
+        "platform": extract_platform(normalised),
+        "editions": extract_editions(normalised),
+        "tokens": core_tokens(normalised),
+    }
+
+def score_candidate(target, candidate):
+    if target["platform"] and candidate["platform"] and target["platform"] != candidate["platform"]:
+        return 0.0
+
+    target_tokens, candidate_tokens = set(target["tokens"]), set(candidate["tokens"])
+    if not target_tokens or not candidate_tokens:
+        return 0.0
+
+    # Sequel numbers and years in the query ("FIFA 23" vs "FIFA 22") must agree exactly.
+    target_numbers = {t for t in target_tokens if t.isdigit()}
+    if target_numbers and target_numbers != {t for t in candidate_tokens if t.isdigit()}:
+        return 0.1
+
+    overlap = len(target_tokens & candidate_tokens)
+    recall = overlap / len(target_tokens)
+    precision = overlap / len(candidate_tokens)
+    sequence = SequenceMatcher(None, " ".join(target["tokens"]), " ".join(candidate["tokens"])).ratio()
+    score = 0.5 * recall + 0.3 * precision + 0.2 * sequence
+
+    if target["editions"] != candidate["editions"]:
+        score -= 0.15
+    if target["platform"] and not candidate["platform"]:
+        score -= 0.1
+    return max(score, 0.0)
+
+def rank_candidates(query, vinted_item_details, cex_results):
+    target = describe(query)
+    title_info = describe(vinted_item_details.get('title', ''))
+    # The LLM query drops editions and sometimes the platform; recover them from the listing title.
+    target["platform"] = target["platform"] or title_info["platform"]
+    target["editions"] = target["editions"] or title_info["editions"]
+
+    ranked = []
+    for result in cex_results:
+        candidate = describe(f"{result['title']} {result.get('category', '')}")
+        ranked.append((score_candidate(target, candidate), result))
+    ranked.sort(key=lambda pair: pair[0], reverse=True)
+    return ranked
+
+def match_locally(query, vinted_item_details, cex_results):
+    ranked = rank_candidates(query, vinted_item_details, cex_results)
+    if not ranked:
+        return "reject", None, 0.0
+    best_score, best = ranked[0]
+    runner_up = ranked[1][0] if len(ranked) > 1 else 0.0
+    if best_score >= config.MATCH_ACCEPT_SCORE and best_score - runner_up >= config.MATCH_MIN_MARGIN:
+        return "accept", best, best_score
+    if best_score < config.MATCH_REJECT_SCORE:
+        return "reject", None, best_score
+    return "ambiguous", best, best_score
+
+def should_audit():
+    return random.random() < config.MATCH_AUDIT_RATE
+
+def record_decision(decision):
+    with _stats_lock:
+        _stats[decision] += 1
+
+def record_agreement(local_link, llm_link):
+    with _stats_lock:
+        _stats["compared"] += 1
+        if local_link == llm_link:
+            _stats["agreed"] += 1
+
+def match_report():
+    with _stats_lock:
+        stats = dict(_stats)
+    total = stats["local_accept"] + stats["local_reject"] + stats["llm"]
+    if not total:
+        return "Matcher: no CeX results were matched."
+    skip_rate = (stats["local_accept"] + stats["local_reject"]) / total
+    agreement = f"{stats['agreed'] / stats['compared']:.0%}" if stats["compared"] else "n/a"
+    return (
+        f"Matcher: {stats['local_accept']} accepted and {stats['local_reject']} rejected locally, "
+        f"{stats['llm']} sent to the LLM ({skip_rate:.0%} LLM skip rate); "
+        f"local/LLM agreement {agreement} over {stats['compared']} compared matches"
+    )
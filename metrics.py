@@ -0,0 +1,139 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+import config
+
+# Upper bounds, in seconds, of the latency histogram buckets. Anything slower lands in +Inf.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+PREFIX = "vinted_scraper_"
+
+_histograms = {}
+_counters = {}
+_lock = threading.Lock()
+
+class Histogram:
+    __slots__ = ("buckets", "count", "sum", "max")
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        index = 0
+        while index < len(BUCKETS) and seconds > BUCKETS[index]:
+            index += 1
+        self.buckets[index] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, fraction):
+        # Upper bound of the bucket holding the quantile; the maximum for the overflow bucket.
+        if not self.count:
+            return None
+        target = fraction * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.buckets):
+            seen += bucket_count
+            if seen >= target:
+                return min(BUCKETS[index], self.max) if index < len(BUCKETS) else self.max
+        return self.max
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+def observe(name, seconds, **labels):
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram()
+        histogram.observe(seconds)
+
+@contextmanager
+def timer(name, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+def increment(name, amount=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+def snapshot():
+    with _lock:
+        histograms = {
+            key: {
+                "count": h.count,
+                "sum": h.sum,
+                "max": h.max,
+                "p50": h.quantile(0.5),
+                "p95": h.quantile(0.95),
+                "buckets": list(h.buckets),
+            }
+            for key, h in _histograms.items()
+        }
+        counters = dict(_counters)
+    return histograms, counters
+
+def metrics_report():
+    histograms, counters = snapshot()
+    lines = []
+    # Slowest stages first, so the summary shows where the run's time went.
+    for (name, labels), stats in sorted(histograms.items(), key=lambda entry: entry[1]["sum"], reverse=True):
+        lines.append(
+            f"{name}{format_labels(labels)}: {stats['count']} timed, {stats['sum']:.1f}s total, "
+            f"mean {stats['sum'] / stats['count']:.3f}s, p95 <= {stats['p95']:.3f}s, max {stats['max']:.3f}s"
+        )
+    for (name, labels), value in sorted(counters.items()):
+        lines.append(f"{name}{format_labels(labels)}: {value}")
+    return lines
+
+def export_prometheus(path):
+    histograms, counters = snapshot()
+    lines = []
+    for name in sorted({name for name, _ in histograms}):
+        lines.append(f"# TYPE {PREFIX}{name} histogram")
+        for (metric, labels), stats in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, bucket_count in zip(list(BUCKETS) + ["+Inf"], stats["buckets"]):
+                cumulative += bucket_count
+                lines.append(f"{PREFIX}{name}_bucket{format_labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{PREFIX}{name}_sum{format_labels(labels)} {stats['sum']:.6f}")
+            lines.append(f"{PREFIX}{name}_count{format_labels(labels)} {stats['count']}")
+    for name in sorted({name for name, _ in counters}):
+        lines.append(f"# TYPE {PREFIX}{name} counter")
+        for (metric, labels), value in sorted(counters.items()):
+            if metric == name:
+                lines.append(f"{PREFIX}{name}{format_labels(labels)} {value}")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+def export_json(path):
+    histograms, counters = snapshot()
+    data = {
+        "bucket_bounds": list(BUCKETS),
+        "histograms": [dict(name=name, labels=dict(labels), **stats) for (name, labels), stats in sorted(histograms.items())],
+        "counters": [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in sorted(counters.items())],
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+
+def write_exports():
+    if config.METRICS_PROMETHEUS_PATH:
+        export_prometheus(config.METRICS_PROMETHEUS_PATH)
+    if config.METRICS_JSON_PATH:
+        export_json(config.METRICS_JSON_PATH)
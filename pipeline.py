@@ -0,0 +1,192 @@
+import asyncio
+import concurrent.futures
+from collections import defaultdict
+import config
+from scraper import (
+    iter_vinted_search_results,
+    iter_triaged_items,
+    iter_price_bounded_items,
+    fetch_item_for_batch,
+    generate_cex_queries_batch,
+    get_cex_buy_price,
+    score_item,
+    record_item_result
+)
+from utils import get_driver, timed_stage
+from sharding import iter_partition
+
+DONE = object()
+
+def search_term(unit, pool, emit):
+    term, part, parts = unit
+    print(f"\n--- Scraping Vinted for: '{term}' ---" if parts == 1 else f"\n--- Scraping Vinted for: '{term}' (part {part + 1} of {parts}) ---")
+    count = 0
+    with pool.lease() as driver:
+        search_results = iter_vinted_search_results(driver, term, num_items_to_check=config.ITEMS_TO_CHECK_PER_TERM)
+        listings = iter_partition(iter_price_bounded_items(search_results, term), part, parts)
+        for item in iter_triaged_items(listings, term):
+            emit(item)
+            count += 1
+    print(f"Found {count} items to analyse for '{term}'.")
+
+def lookup_cex_price(item):
+    log_messages = [f"Pricing: {item['title']} ({item['link']})"]
+    try:
+        driver = get_driver() if config.CEX_BACKEND != 'api' else None
+        with timed_stage(item, "cex"):
+            item['cex'] = get_cex_buy_price(driver, item['clean_query'], item, log_messages)
+    except Exception as e:
+        log_messages.append(f"!! CeX lookup failed: {e}")
+        item['cex'] = None
+    finally:
+        print("\n".join(log_messages))
+    return item
+
+def sink_item(item):
+    log_messages = [f"Result for: {item['link']}"]
+    try:
+        record_item_result(item, item['search_term'], log_messages)
+    finally:
+        print("\n".join(log_messages))
+
+class Pipeline:
+    def __init__(self, units, pool):
+        self.units = units
+        self.pool = pool
+        self.counts = defaultdict(int)
+        # Browser work is capped at MAX_WORKERS threads, each leasing a driver from the pool per task.
+        self.browser_executor = concurrent.futures.ThreadPoolExecutor(max_workers=config.MAX_WORKERS)
+        self.search_executor = concurrent.futures.ThreadPoolExecutor(max_workers=config.PIPELINE_SEARCH_CONCURRENCY)
+        self.io_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=config.PIPELINE_LLM_CONCURRENCY + config.PIPELINE_CEX_CONCURRENCY
+        )
+
+    def run(self):
+        try:
+            asyncio.run(self._run())
+        finally:
+            for executor in (self.browser_executor, self.search_executor, self.io_executor):
+                executor.shutdown(wait=True)
+            print("\nPipeline stage counts: " + ", ".join(f"{name}={count}" for name, count in self.counts.items()))
+
+    async def _run(self):
+        units = asyncio.Queue()
+        self.fetch_queue = fetch_queue = asyncio.Queue(config.PIPELINE_QUEUE_SIZE)
+        query_queue = asyncio.Queue(config.PIPELINE_QUEUE_SIZE)
+        cex_queue = asyncio.Queue(config.PIPELINE_QUEUE_SIZE)
+        score_queue = asyncio.Queue(config.PIPELINE_QUEUE_SIZE)
+        sink_queue = asyncio.Queue(config.PIPELINE_QUEUE_SIZE)
+
+        for unit in self.units:
+            units.put_nowait(unit)
+        units.put_nowait(DONE)
+
+        await asyncio.gather(
+            self._stage("search", units, fetch_queue, config.PIPELINE_SEARCH_CONCURRENCY, self._search),
+            self._stage("fetch", fetch_queue, query_queue, config.MAX_WORKERS, self._fetch),
+            self._stage("query", query_queue, cex_queue, config.PIPELINE_LLM_CONCURRENCY, None, batch=True),
+            self._stage("cex", cex_queue, score_queue, config.PIPELINE_CEX_CONCURRENCY, self._cex),
+            self._stage("score", score_queue, sink_queue, 1, self._score),
+            self._stage("sink", sink_queue, None, 1, self._sink),
+        )
+
+    async def _call(self, executor, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+
+    async def _stage(self, name, inbox, outbox, concurrency, handler, batch=False):
+        worker = self._batch_worker if batch else self._worker
+        await asyncio.gather(*(worker(name, inbox, outbox, handler) for _ in range(concurrency)))
+        if outbox is not None:
+            await outbox.put(DONE)
+
+    async def _worker(self, name, inbox, outbox, handler):
+        while True:
+            entry = await inbox.get()
+            if entry is DONE:
+                await inbox.put(DONE)
+                return
+            try:
+                results = await handler(entry)
+            except Exception as e:
+                print(f"A task in the '{name}' stage generated an exception: {e}")
+                continue
+            self.counts[name] += 1
+            if outbox is not None:
+                for result in results:
+                    await outbox.put(result)
+
+    async def _batch_worker(self, name, inbox, outbox, handler):
+        loop = asyncio.get_running_loop()
+        finished = False
+        while not finished:
+            entry = await inbox.get()
+            if entry is DONE:
+                await inbox.put(DONE)
+                return
+            batch = [entry]
+            deadline = loop.time() + config.PIPELINE_BATCH_WAIT_SECONDS
+            while len(batch) < config.LLM_BATCH_SIZE:
+                try:
+                    entry = await asyncio.wait_for(inbox.get(), max(deadline - loop.time(), 0))
+                except asyncio.TimeoutError:
+                    break
+                if entry is DONE:
+                    await inbox.put(DONE)
+                    finished = True
+                    break
+                batch.append(entry)
+
+            for item in await self._queries(batch):
+                self.counts[name] += 1
+                await outbox.put(item)
+
+    async def _queries(self, batch):
+        by_term = defaultdict(list)
+        for item in batch:
+            by_term[item['search_term']].append(item)
+        for term, items in by_term.items():
+            log_messages = [f"Generating CeX queries for {len(items)} '{term}' items..."]
+            try:
+                queries = await self._call(self.io_executor, generate_cex_queries_batch, items, term, log_messages)
+            except Exception as e:
+                log_messages.append(f"!! Query generation failed: {e}")
+                queries = [item.get('title', 'N/A') for item in items]
+            print("\n".join(log_messages))
+            for item, query in zip(items, queries):
+                item['clean_query'] = query
+        return batch
+
+    async def _search(self, unit):
+        # Listings are pushed to the fetch stage as the search page scrolls, blocking when it is full.
+        loop = asyncio.get_running_loop()
+
+        def emit(item):
+            asyncio.run_coroutine_threadsafe(self.fetch_queue.put(item), loop).result()
+
+        await self._call(self.search_executor, search_term, unit, self.pool, emit)
+        return []
+
+    async def _fetch(self, item):
+        # A rate-limited item is retried here; the Vinted limiter has already backed off.
+        for attempt in range(config.RATE_LIMIT_MAX_REQUEUES + 1):
+            is_fetched = await self._call(self.browser_executor, self.pool.run, fetch_item_for_batch, item)
+            if not item.pop('rate_limited', False):
+                break
+        return [item] if is_fetched else []
+
+    async def _cex(self, item):
+        if config.CEX_BACKEND == 'api':
+            return [await self._call(self.io_executor, lookup_cex_price, item)]
+        # The Selenium backend needs a browser, so it shares the browser threads and pool.
+        return [await self._call(self.browser_executor, self.pool.run, lookup_cex_price, item)]
+
+    async def _score(self, item):
+        score_item(item, item.get('cex'))
+        return [item]
+
+    async def _sink(self, item):
+        await self._call(self.io_executor, sink_item, item)
+        return []
+
+def run_pipeline(units, pool):
+    Pipeline(units, pool).run()
@@ -0,0 +1,112 @@
+import threading
+import time
+from contextlib import contextmanager
+import config
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+class RateLimitSlot:
+    def __init__(self):
+        self.is_rate_limited = False
+
+    def rate_limited(self):
+        self.is_rate_limited = True
+
+class HostLimiter:
+    # Token bucket for request rate plus an AIMD concurrency window: both grow additively while
+    # responses are healthy and are cut multiplicatively (with a cooldown) on a rate-limit response.
+    def __init__(self, host, rate, min_rate, max_rate, max_concurrency):
+        self.host = host
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.rate_step = rate * 0.1
+        self.max_concurrency = max_concurrency
+        self.concurrency = 1.0
+        self.tokens = 1.0
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.stats = {"requests": 0, "rate_limited": 0}
+        self._updated = time.monotonic()
+        self._cond = threading.Condition()
+
+    def acquire(self, timeout=None):
+        # Returns False if no slot became free within timeout (0 only takes a slot that is free now).
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                elif self.in_flight >= int(self.concurrency):
+                    wait = None
+                elif self.tokens < 1:
+                    wait = (1 - self.tokens) / self.rate
+                else:
+                    self.tokens -= 1
+                    self.in_flight += 1
+                    self.stats["requests"] += 1
+                    return True
+                if deadline is not None:
+                    if now >= deadline:
+                        return False
+                    wait = deadline - now if wait is None else min(wait, deadline - now)
+                self._cond.wait(wait)
+
+    def release(self, outcome="ok"):
+        with self._cond:
+            self.in_flight -= 1
+            if outcome == "rate_limited":
+                self.stats["rate_limited"] += 1
+                self.rate = max(self.min_rate, self.rate * config.RATE_LIMIT_BACKOFF)
+                self.concurrency = max(1.0, self.concurrency * config.RATE_LIMIT_BACKOFF)
+                self.paused_until = time.monotonic() + config.RATE_LIMIT_COOLDOWN_SECONDS
+                self.tokens = 0.0
+            elif outcome == "ok":
+                self.rate = min(self.max_rate, self.rate + self.rate_step)
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1.0 / self.concurrency)
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        slot = RateLimitSlot()
+        outcome = "ok"
+        try:
+            yield slot
+        except BaseException:
+            outcome = "error"
+            raise
+        finally:
+            self.release("rate_limited" if slot.is_rate_limited else outcome)
+
+    def snapshot(self):
+        with self._cond:
+            return dict(self.stats, rate=self.rate, concurrency=int(self.concurrency))
+
+    def _refill(self, now):
+        # Allow a burst of up to one second's worth of requests.
+        self.tokens = min(max(1.0, self.rate), self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+def get_limiter(host):
+    with _limiters_lock:
+        limiter = _limiters.get(host)
+        if limiter is None:
+            limiter = HostLimiter(host, **config.RATE_LIMITS[host])
+            _limiters[host] = limiter
+        return limiter
+
+def limiter_report():
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    lines = []
+    for limiter in limiters:
+        stats = limiter.snapshot()
+        lines.append(
+            f"{limiter.host}: {stats['requests']} requests, {stats['rate_limited']} rate limited, "
+            f"settled at {stats['rate']:.2f} req/s with {stats['concurrency']} concurrent"
+        )
+    return lines
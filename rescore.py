@@ -0,0 +1,137 @@
+import argparse
+import json
+import os
+import time
+from urllib.parse import parse_qs, urlparse
+import numpy as np
+import config
+from cex_catalogue import CexCatalogue
+from seen_index import SeenIndex
+
+POSTAGE_MODELS = ("listed", "flat")
+
+def box_id_from_link(link):
+    ids = parse_qs(urlparse(link or "").query).get("id")
+    return ids[0] if ids else None
+
+def load_listings(index, since=None):
+    # One array per column, one entry per listing with a CeX match. Unknown postage is NaN, and each
+    # listing's CeX product is stored as an index into "products".
+    rows = index.scored_listings(since)
+    product_codes = {}
+    return {
+        "item_id": np.array([row['item_id'] for row in rows], dtype=np.int64),
+        "price": np.array([row['price'] for row in rows], dtype=np.float64),
+        "postage": np.array([row['postage'] for row in rows], dtype=np.float64),
+        "cex_price": np.array([row['cex_price'] for row in rows], dtype=np.float64),
+        "product": np.array([product_codes.setdefault(row['cex_link'], len(product_codes)) for row in rows], dtype=np.int64),
+        "products": list(product_codes),
+        "title": [row['title'] for row in rows],
+        "link": [row['link'] for row in rows],
+        "search_term": [row['search_term'] for row in rows],
+    }
+
+def current_cex_prices(columns, boxes):
+    # Looks up each distinct CeX product once; listings whose product is not in the catalogue keep
+    # the price they were scored with.
+    prices = np.full(len(columns["products"]), np.nan)
+    for i, link in enumerate(columns["products"]):
+        box = boxes.get(box_id_from_link(link))
+        if box is not None:
+            prices[i] = box[2]
+    current = prices[columns["product"]]
+    is_current = ~np.isnan(current)
+    return np.where(is_current, current, columns["cex_price"]), is_current
+
+def score(columns, cex_prices, fixed_fee, fee_rate, postage_model, postage):
+    # Vectorised calculate_pnl: returns (profit, total Vinted cost) for every listing.
+    price = columns["price"]
+    if postage_model == "flat":
+        postage_cost = np.full_like(price, postage)
+    elif postage_model == "listed":
+        postage_cost = np.where(np.isnan(columns["postage"]), postage, columns["postage"])
+    else:
+        raise ValueError(f"Unknown postage model '{postage_model}', expected one of {POSTAGE_MODELS}.")
+    total_cost = price + postage_cost + fixed_fee + price * fee_rate
+    return cex_prices - total_cost, total_cost
+
+def rank(profit, total_cost, min_profit, min_margin, top=None):
+    # Indices of the listings that clear both thresholds, most profitable first.
+    margin = np.divide(profit, total_cost, out=np.zeros_like(profit), where=total_cost > 0)
+    candidates = np.flatnonzero((profit > min_profit) & (margin >= min_margin))
+    if top and len(candidates) > top:
+        candidates = candidates[np.argpartition(-profit[candidates], top - 1)[:top]]
+    return candidates[np.argsort(-profit[candidates], kind="stable")], margin
+
+def opportunity_record(columns, i, cex_prices, profit, total_cost, margin):
+    return {
+        "item_id": int(columns["item_id"][i]),
+        "link": columns["link"][i],
+        "title": columns["title"][i],
+        "search_term": columns["search_term"][i],
+        "price": float(columns["price"][i]),
+        "total_vinted_cost": round(float(total_cost[i]), 2),
+        "cex_price": float(cex_prices[i]),
+        "scored_cex_price": float(columns["cex_price"][i]),
+        "cex_link": columns["products"][columns["product"][i]],
+        "pnl": round(float(profit[i]), 2),
+        "margin": round(float(margin[i]), 4),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-score every stored listing against current CeX prices, without scraping.")
+    parser.add_argument("--since-days", type=float, help="Only listings seen in the last N days.")
+    parser.add_argument("--fixed-fee", type=float, default=config.BUYER_PROTECTION_FIXED_FEE, help="Buyer protection fixed fee (£).")
+    parser.add_argument("--fee-rate", type=float, default=config.BUYER_PROTECTION_RATE, help="Buyer protection share of the price.")
+    parser.add_argument("--postage-model", choices=POSTAGE_MODELS, default=config.RESCORE_POSTAGE_MODEL)
+    parser.add_argument("--postage", type=float, default=config.RESCORE_POSTAGE, help="Flat postage, or the default when a listing's is unknown.")
+    parser.add_argument("--min-profit", type=float, default=config.RESCORE_MIN_PROFIT)
+    parser.add_argument("--min-margin", type=float, default=config.RESCORE_MIN_MARGIN, help="Minimum profit as a share of the total Vinted cost.")
+    parser.add_argument("--top", type=int, default=config.RESCORE_TOP, help="How many opportunities to show (0 for all).")
+    parser.add_argument("--stored-prices", action="store_true", help="Keep the CeX prices listings were scored with; only the fee model changes.")
+    parser.add_argument("--output", help="Also write the ranked opportunities to this JSONL file.")
+    args = parser.parse_args()
+
+    index = SeenIndex(config.SEEN_INDEX_PATH)
+    boxes = {}
+    if not args.stored_prices and os.path.exists(config.CEX_CATALOGUE_PATH):
+        catalogue = CexCatalogue(config.CEX_CATALOGUE_PATH)
+        boxes = catalogue.boxes
+        catalogue.close()
+    try:
+        start = time.perf_counter()
+        columns = load_listings(index, time.time() - args.since_days * 86400 if args.since_days else None)
+        load_ms = (time.perf_counter() - start) * 1000
+    finally:
+        index.close()
+
+    start = time.perf_counter()
+    cex_prices, is_current = current_cex_prices(columns, boxes)
+    profit, total_cost = score(columns, cex_prices, args.fixed_fee, args.fee_rate, args.postage_model, args.postage)
+    ranked, margin = rank(profit, total_cost, args.min_profit, args.min_margin, args.top)
+    was_profitable = score(columns, columns["cex_price"], args.fixed_fee, args.fee_rate, args.postage_model, args.postage)[0] > 0
+    score_ms = (time.perf_counter() - start) * 1000
+
+    records = [opportunity_record(columns, i, cex_prices, profit, total_cost, margin) for i in ranked]
+    for position, record in enumerate(records, 1):
+        change = record['cex_price'] - record['scored_cex_price']
+        print(
+            f"{position:>3}. £{record['pnl']:>7.2f} ({record['margin']:.0%})  £{record['price']:.2f} on Vinted, "
+            f"CeX pays £{record['cex_price']:.2f}" + (f" ({change:+.2f})" if change else "")
+            + f"  {record['title']}  {record['link']}"
+        )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        print(f"Wrote {len(records)} opportunities to {args.output}")
+
+    is_profitable = profit > 0
+    print(
+        f"Re-scored {len(profit)} listings ({int(is_current.sum())} at current catalogue prices) in {score_ms:.1f} ms, "
+        f"loaded in {load_ms:.0f} ms: {int(is_profitable.sum())} profitable, "
+        f"{int((is_profitable & ~was_profitable).sum())} newly and {int((was_profitable & ~is_profitable).sum())} no longer."
+    )
+
+if __name__ == "__main__":
+    main()
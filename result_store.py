@@ -0,0 +1,195 @@
+import argparse
+import json
+import os
+import queue
+import sqlite3
+import threading
+from datetime import datetime
+import config
+from seen_index import parse_item_id
+
+_store = None
+_store_lock = threading.Lock()
+_STOP = object()
+
+RESULT_COLUMNS = (
+    "run_id", "recorded_at", "search_term", "item_id", "link", "title", "price", "postage",
+    "buyer_protection_fee", "total_vinted_cost", "cex_price", "cex_link", "pnl", "verdict", "clean_query",
+)
+
+def result_record(item, search_term, run_id):
+    cex_data = item.get('cex') or {}
+    postage = item.get('postage')
+    return {
+        "run_id": run_id,
+        "recorded_at": datetime.now().isoformat(timespec="seconds"),
+        "search_term": search_term,
+        "item_id": parse_item_id(item.get('link')),
+        "link": item.get('link'),
+        "title": item.get('title'),
+        "price": item.get('price'),
+        "postage": postage if isinstance(postage, (int, float)) else None,
+        "buyer_protection_fee": item.get('buyer_protection_fee'),
+        "total_vinted_cost": item.get('total_vinted_cost'),
+        "cex_price": cex_data.get('price'),
+        "cex_link": cex_data.get('link'),
+        "pnl": item.get('pnl'),
+        "verdict": item.get('verdict'),
+        "clean_query": item.get('clean_query'),
+        "scraped_attributes": item.get('scraped_attributes') or {},
+        "description": item.get('description'),
+        "timings": item.get('timings') or {},
+    }
+
+class ResultStore:
+    # Every evaluated listing goes through one writer thread, which appends it to the JSONL file
+    # and, if configured, the SQLite table in batches.
+    def __init__(self, jsonl_path, sqlite_path=None):
+        self.jsonl_path = jsonl_path
+        self.sqlite_path = sqlite_path
+        self.run_id = os.getenv("GITHUB_RUN_ID") or datetime.now().strftime("%Y%m%d-%H%M%S")
+        self.written = 0
+        self._queue = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="result-store-writer", daemon=True)
+        self._writer.start()
+
+    def record(self, item, search_term):
+        self._queue.put(result_record(item, search_term, self.run_id))
+
+    def close(self):
+        self._queue.put(_STOP)
+        self._writer.join()
+
+    def _write_loop(self):
+        conn = self._connect() if self.sqlite_path else None
+        try:
+            with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                stopping = False
+                while not stopping:
+                    record = self._queue.get()
+                    if record is _STOP:
+                        break
+                    batch = [record]
+                    while len(batch) < config.RESULT_STORE_BATCH_SIZE:
+                        try:
+                            record = self._queue.get(timeout=config.RESULT_STORE_FLUSH_SECONDS)
+                        except queue.Empty:
+                            break
+                        if record is _STOP:
+                            stopping = True
+                            break
+                        batch.append(record)
+                    self._write_batch(f, conn, batch)
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def _connect(self):
+        directory = os.path.dirname(self.sqlite_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.sqlite_path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, run_id TEXT, recorded_at TEXT, search_term TEXT, "
+            "item_id INTEGER, link TEXT, title TEXT, price REAL, postage REAL, buyer_protection_fee REAL, "
+            "total_vinted_cost REAL, cex_price REAL, cex_link TEXT, pnl REAL, verdict TEXT, clean_query TEXT, "
+            "timings TEXT, record TEXT NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS results_verdict ON results (verdict, run_id)")
+        conn.commit()
+        return conn
+
+    def _write_batch(self, f, conn, batch):
+        f.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in batch))
+        f.flush()
+        if conn is not None:
+            conn.executemany(
+                f"INSERT INTO results ({', '.join(RESULT_COLUMNS)}, timings, record) "
+                f"VALUES ({', '.join('?' for _ in RESULT_COLUMNS)}, ?, ?)",
+                [
+                    tuple(record[column] for column in RESULT_COLUMNS)
+                    + (json.dumps(record['timings']), json.dumps(record, ensure_ascii=False))
+                    for record in batch
+                ],
+            )
+            conn.commit()
+        self.written += len(batch)
+
+def get_result_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ResultStore(config.RESULTS_JSONL_PATH, config.RESULTS_SQLITE_PATH)
+        return _store
+
+def close_result_store():
+    global _store
+    with _store_lock:
+        if _store is not None:
+            _store.close()
+            print(f"Result store: {_store.written} results written to {_store.jsonl_path}")
+            _store = None
+
+def iter_results(path):
+    if not os.path.exists(path):
+        return
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def format_profit_entry(record):
+    timestamp = datetime.fromisoformat(record['recorded_at']).strftime("%Y-%m-%d %H:%M:%S")
+    postage_str = f"£{record['postage']:.2f}" if record['postage'] is not None else "N/A"
+
+    scraped_attrs_str = ""
+    for attr_key, attr_value in record['scraped_attributes'].items():
+        scraped_attrs_str += f"      - {attr_key}: {attr_value}\n"
+    if not scraped_attrs_str:
+        scraped_attrs_str = "      (No additional attributes found)\n"
+
+    description_output = ""
+    if record.get('description'):
+        description_output = f"  -> Description: {record['description'][:100]}...\n"
+
+    return f"""
+--- Potential Profit Found [{timestamp}] ---
+Search Category: {record['search_term']}
+Vinted item: {record['title']}
+  -> Price: £{record['price']:.2f}, Postage: {postage_str}
+  -> Link to buy: {record['link']}
+  -> Scraped Attributes:
+{scraped_attrs_str.strip()}
+{description_output.strip()}
+  -> CeX webuy price: £{record['cex_price']:.2f}
+  -> CeX sell page: {record['cex_link']}
+  -> Total Vinted cost (inc. fees): ~£{record['total_vinted_cost']:.2f}
+  ✅ Potential profit: £{record['pnl']:.2f}
+------------------------------------
+"""
+
+def render_report(records, run_id=None):
+    # The same text the scraper used to append to PROFIT_LOG_FILE, one entry per profitable result.
+    profits = [
+        record for record in records
+        if record['verdict'] == "profit" and (run_id is None or record['run_id'] == run_id)
+    ]
+    return "".join(format_profit_entry(record) for record in profits), len(profits)
+
+def main():
+    parser = argparse.ArgumentParser(description="Work with the structured results of scraper runs.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    report_parser = subparsers.add_parser("report", help="Render the human-readable profit report.")
+    report_parser.add_argument("output", nargs="?", default=config.PROFIT_LOG_FILE)
+    report_parser.add_argument("--run", help="Only include results from this run id.")
+    args = parser.parse_args()
+
+    report, count = render_report(iter_results(config.RESULTS_JSONL_PATH), args.run)
+    with open(args.output, "w", encoding="utf-8") as f:
+        f.write(report)
+    print(f"Wrote {count} profitable results to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,7 @@
-import os
+import json
 import re
+import threading
 import time
-import random
-from openai import OpenAI
-from dotenv import load_dotenv
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
@@ -14,36 +12,56 @@ from selenium.common.exceptions import (
     WebDriverException
 )
 from urllib3.exceptions import MaxRetryError, NewConnectionError
+import httpx
+
+import config
+from cache import get_cache
+from cex_api import search_boxes
+from cex_catalogue import get_catalogue
+from llm import get_openai_client, chat_completion, get_cached_completion, store_completion
+from utils import get_driver, timed_stage, page_transfer_bytes, lease_fallback_driver
+from seen_index import get_seen_index, parse_item_id
+from result_store import get_result_store
+from debug_capture import capture_html, capture_page, debug_note
+from work_queue import get_work_queue, STATES
+from vinted_parser import parse_vinted_item_html
+from rate_limit import get_limiter
+import metrics
+from matcher import match_locally, record_decision, record_agreement, should_audit
+from singleflight import get_flight
+
+# Terms are sets so a term searched many times (each poll in watch mode) counts once.
+_prune_stats = {"terms": set(), "pruned": 0, "stopped_terms": set()}
+_prune_stats_lock = threading.Lock()
+
+CEX_QUERY_RULES = """
+        - The query should be the core product name and platform ONLY (e.g., "Hogwarts Legacy PS5", "Xbox Series X 1TB Console").
+        - CeX's search engine is very strict. DO NOT include extra details like "Steelbook Edition", "unlocked", "sealed", or condition notes unless it is the core identity of the product.
+        - Prioritise specific identifiers like Brand, Model, Platform, Storage.
+        - Ignore extra words like "disc only", "for", "very good condition", "cracked screen", "fast postage", "uploaded X hours ago", "bought as a present", "used a handful of times", "disk is scratch free" etc.
+        - If the title/details indicate multiple items (e.g., a bundle of games), try to create a query for the most prominent single item that CeX would likely buy, or the first identifiable main product. If it's too complex or clearly multiple distinct items not sold together by CeX, return 'N/A'.
+        - If the item is a generic accessory (like a 'case', 'cable', 'stand', 'controller grip') and not a specific, named product that CeX would buy (like a specific controller or console), return the single word: N/A"""
 
-from utils import get_driver, log_profit_detailed
+CEX_QUERY_SYSTEM_PROMPT = "You are a highly intelligent product normalisation assistant, skilled at creating concise CeX search queries from Vinted product details. Your output must ONLY be the clean search query."
 
-def generate_cex_query_from_vinted_listing(vinted_item_details, category, log_messages):
-    load_dotenv()
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        log_messages.append("-> ERROR: OPENAI_API_KEY not found in .env file. Using item title as fallback.")
-        return vinted_item_details.get('title', 'N/A')
+CEX_QUERY_BATCH_SYSTEM_PROMPT = "You are a highly intelligent product normalisation assistant, skilled at creating concise CeX search queries from Vinted product details. Your output must ONLY be a JSON object of the form {\"queries\": [...]}, with one clean search query per listing, in order."
 
-    title = vinted_item_details.get('title', '')
-    description = vinted_item_details.get('description', '')
-    
+def format_scraped_attributes(vinted_item_details):
     attributes_str = ""
     scraped_attributes = vinted_item_details.get('scraped_attributes', {})
     for key, value in scraped_attributes.items():
         attributes_str += f"- {key}: {value}\n"
     if not attributes_str:
         attributes_str = "No additional attributes found."
+    return attributes_str
 
-    try:
-        client = OpenAI(api_key=api_key)
-        prompt = f"""
-        From the following Vinted product title, description, and additional scraped attributes, generate a concise search query for the CeX website.
-        - The query should be the core product name and platform ONLY (e.g., "Hogwarts Legacy PS5", "Xbox Series X 1TB Console").
-        - CeX's search engine is very strict. DO NOT include extra details like "Steelbook Edition", "unlocked", "sealed", or condition notes unless it is the core identity of the product.
-        - Prioritise specific identifiers like Brand, Model, Platform, Storage.
-        - Ignore extra words like "disc only", "for", "very good condition", "cracked screen", "fast postage", "uploaded X hours ago", "bought as a present", "used a handful of times", "disk is scratch free" etc.
-        - If the title/details indicate multiple items (e.g., a bundle of games), try to create a query for the most prominent single item that CeX would likely buy, or the first identifiable main product. If it's too complex or clearly multiple distinct items not sold together by CeX, return 'N/A'.
-        - If the item is a generic accessory (like a 'case', 'cable', 'stand', 'controller grip') and not a specific, named product that CeX would buy (like a specific controller or console), return the single word: N/A
+def build_cex_query_messages(vinted_item_details, category):
+    title = vinted_item_details.get('title', '')
+    description = vinted_item_details.get('description', '')
+    attributes_str = format_scraped_attributes(vinted_item_details)
+
+    prompt = f"""
+        From the following Vinted product title, description, and additional scraped attributes, generate a concise search query for the CeX website.{CEX_QUERY_RULES}
         Category: "{category}"
         Vinted Title: "{title}"
         Vinted Description: "{description}"
@@ -53,32 +71,129 @@ def generate_cex_query_from_vinted_listing(vinted_item_details, category, log_me
 
         Clean CeX Query:
         """
-        
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You are a highly intelligent product normalisation assistant, skilled at creating concise CeX search queries from Vinted product details. Your output must ONLY be the clean search query."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.0
-        )
-        clean_query = response.choices[0].message.content.strip()
-        log_messages.append(f"-> AI generated query for '{title}': '{clean_query}'")
+    return [
+        {"role": "system", "content": CEX_QUERY_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+def generate_cex_query_from_vinted_listing(vinted_item_details, category, log_messages):
+    client = get_openai_client()
+    if client is None:
+        log_messages.append("-> ERROR: OPENAI_API_KEY not found in .env file. Using item title as fallback.")
+        return vinted_item_details.get('title', 'N/A')
+
+    title = vinted_item_details.get('title', '')
+    try:
+        clean_query, from_cache = chat_completion(client, build_cex_query_messages(vinted_item_details, category))
+        source = "Cached AI" if from_cache else "AI generated"
+        log_messages.append(f"-> {source} query for '{title}': '{clean_query}'")
         return clean_query
     except Exception as e:
         log_messages.append(f"-> AI query failed for '{title}': {e}")
+        mark_lookup_failed(vinted_item_details)
         return title
 
-def select_best_cex_match(vinted_item_details, cex_results, log_messages):
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
+def mark_lookup_failed(item):
+    # A transient failure (API error, timeout, failed AI call): a no_match verdict for the listing is
+    # not final, so it is not recorded in the seen index and the listing is looked at again next run.
+    item['lookup_failed'] = True
+
+def build_cex_query_batch_messages(items, category):
+    listings = ""
+    for i, item in enumerate(items):
+        listings += f"""
+        Listing {i + 1}:
+        Vinted Title: "{item.get('title', '')}"
+        Vinted Description: "{item.get('description', '')}"
+        Additional Scraped Attributes:
+        {format_scraped_attributes(item)}
+"""
+
+    prompt = f"""
+        For each of the following {len(items)} Vinted listings, generate a concise search query for the CeX website, using these rules for every listing:{CEX_QUERY_RULES}
+        Category: "{category}"
+        {listings}
+        Return a JSON object with a single key "queries" holding exactly {len(items)} strings, one per listing, in the same order as the listings.
+        """
+    return [
+        {"role": "system", "content": CEX_QUERY_BATCH_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+def parse_cex_query_batch(content, expected_count):
+    queries = json.loads(content).get('queries')
+    if not isinstance(queries, list) or len(queries) != expected_count:
+        raise ValueError(f"Expected {expected_count} queries in batch response.")
+    if not all(isinstance(query, str) and query.strip() for query in queries):
+        raise ValueError("Batch response contains an empty or non-string query.")
+    return [query.strip() for query in queries]
+
+def generate_cex_queries_batch(items, category, log_messages):
+    start = time.perf_counter()
+    try:
+        return generate_cex_queries_batch_untimed(items, category, log_messages)
+    finally:
+        # Every listing in the batch waited for the whole batch.
+        elapsed = round(time.perf_counter() - start, 3)
+        for item in items:
+            item.setdefault('timings', {})['query'] = elapsed
+
+def generate_cex_queries_batch_untimed(items, category, log_messages):
+    client = get_openai_client()
+    if client is None:
+        log_messages.append("-> ERROR: OPENAI_API_KEY not found in .env file. Using item titles as fallback.")
+        return [item.get('title', 'N/A') for item in items]
+
+    # Items answered by the per-listing response cache never enter a batch.
+    queries = [get_cached_completion(build_cex_query_messages(item, category)) for item in items]
+    pending = [i for i, query in enumerate(queries) if query is None]
+    log_messages.append(f"-> AI batch: {len(items) - len(pending)} cached, {len(pending)} to generate.")
+
+    for start in range(0, len(pending), config.LLM_BATCH_SIZE):
+        resolve_cex_query_batch(client, items, category, pending[start:start + config.LLM_BATCH_SIZE], queries, log_messages)
+    return queries
+
+def resolve_cex_query_batch(client, items, category, indices, queries, log_messages):
+    if len(indices) == 1:
+        queries[indices[0]] = generate_cex_query_from_vinted_listing(items[indices[0]], category, log_messages)
+        return
+
+    batch_items = [items[i] for i in indices]
+    try:
+        content, _ = chat_completion(
+            client,
+            build_cex_query_batch_messages(batch_items, category),
+            use_cache=False,
+            response_format={"type": "json_object"}
+        )
+        batch_queries = parse_cex_query_batch(content, len(indices))
+    except (ValueError, AttributeError) as e:
+        # Batch responses are not cached, so each half is a fresh request.
+        middle = len(indices) // 2
+        log_messages.append(f"-> AI batch of {len(indices)} returned malformed output ({e}). Splitting and retrying.")
+        resolve_cex_query_batch(client, items, category, indices[:middle], queries, log_messages)
+        resolve_cex_query_batch(client, items, category, indices[middle:], queries, log_messages)
+        return
+    except Exception as e:
+        log_messages.append(f"-> AI batch of {len(indices)} failed ({e}). Falling back to per-item queries.")
+        for i in indices:
+            queries[i] = generate_cex_query_from_vinted_listing(items[i], category, log_messages)
+        return
+
+    for i, item, clean_query in zip(indices, batch_items, batch_queries):
+        store_completion(build_cex_query_messages(item, category), clean_query)
+        queries[i] = clean_query
+        log_messages.append(f"-> AI batch generated query for '{item.get('title', '')}': '{clean_query}'")
+
+def select_best_cex_match_llm(vinted_item_details, cex_results, log_messages):
+    client = get_openai_client()
+    if client is None:
         log_messages.append("-> ERROR: OPENAI_API_KEY not found. Cannot select best match.")
         return None
 
     formatted_results = "\n".join([f"{i+1}. Title: {res['title']}, Link: {res['link']}" for i, res in enumerate(cex_results)])
     
     try:
-        client = OpenAI(api_key=api_key)
         prompt = f"""
         You are an expert product matcher. A user wants to find the CeX equivalent of a Vinted item.
         Based on the Vinted item details below, choose the best match from the list of CeX search results.
@@ -98,15 +213,10 @@ def select_best_cex_match(vinted_item_details, cex_results, log_messages):
         4. If no result is a clear match, return the single word: N/A
         """
         
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You are an expert product matcher. Your task is to find the best match for a Vinted item from a list of CeX search results and return only the URL or 'N/A'."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.0
-        )
-        best_match_url = response.choices[0].message.content.strip()
+        best_match_url, _ = chat_completion(client, [
+            {"role": "system", "content": "You are an expert product matcher. Your task is to find the best match for a Vinted item from a list of CeX search results and return only the URL or 'N/A'."},
+            {"role": "user", "content": prompt}
+        ])
         
         if best_match_url and best_match_url.startswith('http'):
             log_messages.append(f"-> AI selected best match: {best_match_url}")
@@ -116,21 +226,125 @@ def select_best_cex_match(vinted_item_details, cex_results, log_messages):
             return None
     except Exception as e:
         log_messages.append(f"-> AI match selection failed: {e}")
+        mark_lookup_failed(vinted_item_details)
         return None
 
+def select_best_cex_match(vinted_item_details, cex_results, log_messages, query=None):
+    decision, local_match, score = match_locally(query or vinted_item_details.get('title', ''), vinted_item_details, cex_results)
+    if decision == "accept":
+        log_messages.append(f"-> Local matcher accepted '{local_match['title']}' (score {score:.2f}).")
+        record_decision("local_accept")
+        if should_audit():
+            record_agreement(local_match['link'], select_best_cex_match_llm(vinted_item_details, cex_results, log_messages))
+        return local_match['link']
+    if decision == "reject":
+        log_messages.append(f"-> Local matcher found no plausible CeX match (best score {score:.2f}).")
+        record_decision("local_reject")
+        return None
+
+    log_messages.append(f"-> Local match is ambiguous (best score {score:.2f}), asking the LLM.")
+    record_decision("llm")
+    best_match_url = select_best_cex_match_llm(vinted_item_details, cex_results, log_messages)
+    record_agreement(local_match['link'], best_match_url)
+    return best_match_url
+
+def get_cex_cache():
+    return get_cache(config.CEX_CACHE_PATH, config.CEX_CACHE_TTL_SECONDS, config.CEX_CACHE_MAX_ENTRIES)
+
+def normalise_query(query):
+    return " ".join(re.sub(r'[^a-z0-9 ]', ' ', query.lower()).split())
 
 def get_cex_buy_price(driver, query, vinted_item_details, log_messages):
     if not query or query.upper() == 'N/A':
         return None
+
+    catalogue = get_catalogue()
+    if catalogue is not None:
+        cex_data = get_cex_buy_price_catalogue(catalogue, query, vinted_item_details, log_messages)
+        if cex_data:
+            return cex_data
+
+    def lookup():
+        cex_data = lookup_cex_buy_price(driver, query, vinted_item_details, log_messages)
+        return cex_data, vinted_item_details.get('lookup_failed', False)
+
+    # Listings of the same product arrive together; identical queries share one lookup per run.
+    flight = get_flight("CeX lookups", memoize=lambda result: result[0] is not None, ttl=config.CEX_CACHE_TTL_SECONDS)
+    (cex_data, lookup_failed), shared = flight.do(normalise_query(query), lookup)
+    if shared:
+        log_messages.append(f"-> CeX: Reused the result of an identical lookup for '{query}'.")
+        if lookup_failed:
+            mark_lookup_failed(vinted_item_details)
+    return cex_data
+
+def lookup_cex_buy_price(driver, query, vinted_item_details, log_messages):
+    cache = get_cex_cache()
+    query_key = f"query:{normalise_query(query)}"
+    cached = cache.get(query_key)
+    if cached:
+        log_messages.append(f"-> CeX: Cached cash price £{cached['price']:.2f} ({cached['link']}).")
+        return cached
+
+    cex_data = None
+    if config.CEX_BACKEND == 'api':
+        try:
+            cex_data = get_cex_buy_price_api(query, vinted_item_details, log_messages)
+        except (httpx.HTTPError, ValueError) as e:
+            log_messages.append(f"-> CeX API request failed ({type(e).__name__}), falling back to browser.")
+            # API lookups run without a browser; one is only leased when the fallback needs it.
+            with lease_fallback_driver(driver) as fallback_driver:
+                if fallback_driver is not None:
+                    cex_data = get_cex_buy_price_selenium(fallback_driver, query, vinted_item_details, log_messages)
+            if cex_data is None:
+                mark_lookup_failed(vinted_item_details)
+    elif driver is not None:
+        cex_data = get_cex_buy_price_selenium(driver, query, vinted_item_details, log_messages)
+
+    if cex_data:
+        cache.set(query_key, cex_data)
+        cache.set(f"link:{cex_data['link']}", cex_data)
+    return cex_data
+
+def get_cex_buy_price_catalogue(catalogue, query, vinted_item_details, log_messages):
+    cex_results = catalogue.lookup(query)
+    if not cex_results:
+        log_messages.append(f"-> CeX catalogue: No entries for query '{query}', querying CeX live.")
+        return None
+    return price_from_cex_results(query, vinted_item_details, cex_results, log_messages)
+
+def get_cex_buy_price_api(query, vinted_item_details, log_messages):
+    cex_results = search_boxes(query)
+    if not cex_results:
+        log_messages.append(f"-> CeX: No search results found for query '{query}'.")
+        return None
+    return price_from_cex_results(query, vinted_item_details, cex_results, log_messages)
+
+def price_from_cex_results(query, vinted_item_details, cex_results, log_messages):
+    with metrics.timer("cex_match_seconds"):
+        best_match_url = select_best_cex_match(vinted_item_details, cex_results, log_messages, query)
+    if not best_match_url:
+        return None
+
+    for result in cex_results:
+        if result['link'] == best_match_url:
+            log_messages.append(f"-> CeX: Found cash price £{result['price']:.2f}.")
+            return {"price": result['price'], "link": result['link']}
+
+    log_messages.append(f"-> CeX: Selected match {best_match_url} is not in the search results.")
+    return None
+
+def get_cex_buy_price_selenium(driver, query, vinted_item_details, log_messages):
     try:
         search_url = f"https://uk.webuy.com/sell/search/?stext={query.replace(' ', '+')}"
-        driver.get(search_url)
+        with get_limiter("webuy.com").slot(), metrics.timer("cex_request_seconds", backend="selenium"):
+            driver.get(search_url)
         try:
             WebDriverWait(driver, 10).until(
                 EC.presence_of_element_located((By.XPATH, "//a[contains(@href,'/sell/product-detail')]"))
             )
         except TimeoutException:
             log_messages.append("-> CeX: Timed out waiting for search results to load.")
+            mark_lookup_failed(vinted_item_details)
             return None
 
         results = driver.find_elements(By.XPATH, "//div[contains(@class, 'search-product-card')]//a")
@@ -150,13 +364,21 @@ def get_cex_buy_price(driver, query, vinted_item_details, log_messages):
 
         if not cex_results:
             log_messages.append("-> CeX: Could not parse any search results.")
+            mark_lookup_failed(vinted_item_details)
             return None
 
-        best_match_url = select_best_cex_match(vinted_item_details, cex_results, log_messages)
+        with metrics.timer("cex_match_seconds"):
+            best_match_url = select_best_cex_match(vinted_item_details, cex_results, log_messages, query)
         if not best_match_url:
             return None
 
-        driver.get(best_match_url)
+        cached = get_cex_cache().get(f"link:{best_match_url}")
+        if cached:
+            log_messages.append(f"-> CeX: Cached cash price £{cached['price']:.2f} for selected match.")
+            return cached
+
+        with get_limiter("webuy.com").slot(), metrics.timer("cex_request_seconds", backend="selenium"):
+            driver.get(best_match_url)
         try:
             accept_btn = WebDriverWait(driver, 5).until(
                 EC.element_to_be_clickable((By.XPATH, "//button[contains(translate(text(),'ABCDEFGHIJKLMNOPQRSTUVWXYZ','abcdefghijklmnopqrstuvwxyz'), 'accept')]"))
@@ -189,17 +411,18 @@ def get_cex_buy_price(driver, query, vinted_item_details, log_messages):
                 log_messages.append(f"-> CeX: Found cash price £{cash_price:.2f}.")
                 return {"price": cash_price, "link": driver.current_url}
             else:
-                log_messages.append("-> CeX: Could not find price in page HTML.")
-                log_messages.append("--- DEBUG: Page HTML at Price Failure ---")
-                log_messages.append(driver.page_source)
-                log_messages.append("--- END DEBUG ---")
+                reference = capture_html("cex_price", driver.current_url, page_html)
+                log_messages.append(f"-> CeX: Could not find price in page HTML. {debug_note(reference)}.")
+                mark_lookup_failed(vinted_item_details)
                 return None
         except TimeoutException:
             log_messages.append("-> CeX: Timed out waiting for trade-in section.")
+            mark_lookup_failed(vinted_item_details)
             return None
 
     except Exception as e:
         log_messages.append(f"-> CeX: An unexpected error occurred during scraping: {type(e).__name__}")
+        mark_lookup_failed(vinted_item_details)
         return None
 
 def scrape_vinted_item_page(driver):
@@ -229,6 +452,10 @@ def scrape_vinted_item_page(driver):
     return scraped_attributes, description
 
 def handle_popups(driver):
+    with metrics.timer("popup_handling_seconds"):
+        dismiss_popups(driver)
+
+def dismiss_popups(driver):
     for _ in range(2):
         try:
             cookie_button = WebDriverWait(driver, 3).until(EC.element_to_be_clickable((By.ID, "onetrust-accept-btn-handler")))
@@ -244,146 +471,347 @@ def handle_popups(driver):
         except (NoSuchElementException, TimeoutException):
             pass
 
+SEARCH_GRID_ITEM_SELECTOR = "div[data-testid='grid-item'] a.new-item-box__overlay"
+
 def scrape_vinted_search_page(driver, query, num_items_to_check=200):
+    return list(iter_vinted_search_results(driver, query, num_items_to_check))
+
+def iter_vinted_search_results(driver, query, num_items_to_check=200, order="price_asc", status=None):
+    # status, if given, gets 'rate_limited' set when the search page never loaded.
     encoded_query = query.replace(' ', '+')
-    search_url = f"https://www.vinted.co.uk/catalog?search_text={encoded_query}&order=price_asc&country_id=1"
+    search_url = f"{config.VINTED_BASE_URL}/catalog?search_text={encoded_query}&order={order}&country_id=1"
     
-    driver.get(search_url)
+    for attempt in range(config.RATE_LIMIT_MAX_REQUEUES + 1):
+        if load_vinted_page(driver, search_url):
+            break
+        print(f"!! Rate limited by Vinted on the search page (attempt {attempt + 1}).")
+    else:
+        if status is not None:
+            status['rate_limited'] = True
+        return
     handle_popups(driver)
 
-    item_links = set()
-    last_height = driver.execute_script("return document.body.scrollHeight")
-    
-    while len(item_links) < num_items_to_check:
-        item_elements = driver.find_elements(By.CSS_SELECTOR, "div[data-testid='grid-item'] a.new-item-box__overlay")
-
-        for el in item_elements:
-            link = el.get_attribute('href')
-            if link:
-                item_links.add(link)
+    seen_links = set()
+    while len(seen_links) < num_items_to_check:
+        # One round trip for every link and overlay title, in grid (i.e. price) order.
+        rows = driver.execute_script(
+            "return Array.from(document.querySelectorAll(arguments[0])).map(a => [a.href, a.title]);",
+            SEARCH_GRID_ITEM_SELECTOR
+        ) or []
+
+        for link, overlay_title in rows:
+            if link and link not in seen_links:
+                seen_links.add(link)
+                yield {'link': link, 'search_price': parse_search_price(overlay_title)}
+                if len(seen_links) >= num_items_to_check:
+                    return
 
         driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-        time.sleep(2)
-        
-        new_height = driver.execute_script("return document.body.scrollHeight")
-        if new_height == last_height:
+        metrics.increment("search_scrolls_total")
+        try:
+            with metrics.timer("search_scroll_wait_seconds"):
+                WebDriverWait(driver, config.SEARCH_SCROLL_TIMEOUT).until(
+                    lambda d: d.execute_script("return document.querySelectorAll(arguments[0]).length;", SEARCH_GRID_ITEM_SELECTOR) > len(rows)
+                )
+        except TimeoutException:
             print("-> Reached the end of the search results.")
-            break
-        last_height = new_height
+            return
 
-    return [{'link': link} for link in list(item_links)[:num_items_to_check]]
+def parse_search_price(overlay_title):
+    # The grid overlay title reads like "Title, brand: X, condition: Y, £10.00, £11.20 includes Buyer Protection".
+    match = re.search(r'£\s*(\d+(?:\.\d+)?)', overlay_title or "")
+    return float(match.group(1)) if match else None
 
+def buyer_protection_fee(price):
+    return config.BUYER_PROTECTION_FIXED_FEE + (price * config.BUYER_PROTECTION_RATE)
 
-def process_item(item, search_category):
-    log_messages = [f"Processing link: {item['link']}"]
-    thread_driver = None
+def calculate_pnl(cex_price, price, postage):
+    total_vinted_cost = price + postage + buyer_protection_fee(price)
+    return cex_price - total_vinted_cost, total_vinted_cost
+
+def get_payout_bound(search_category):
+    if not config.PRICE_BOUND_ENABLED:
+        return None
+    max_cex_price, samples = get_seen_index().payout_history(search_category)
+    if max_cex_price is None or samples < config.PRICE_BOUND_MIN_SAMPLES:
+        return None
+    return max_cex_price * config.PRICE_BOUND_HEADROOM
+
+def iter_price_bounded_items(items, search_category, order="price_asc"):
+    bound = get_payout_bound(search_category)
+    if bound is None:
+        yield from items
+        return
+
+    pruned = 0
+    stopped = False
+    for item in items:
+        search_price = item.get('search_price')
+        if search_price is not None:
+            _, lowest_cost = calculate_pnl(0, search_price, config.PRICE_BOUND_MIN_POSTAGE)
+            if lowest_cost >= bound:
+                pruned += 1
+                if order == "price_asc":
+                    # Every later result costs at least as much, so stop scrolling the search page.
+                    stopped = True
+                    break
+                continue
+        yield item
+
+    with _prune_stats_lock:
+        is_new_term = search_category not in _prune_stats["terms"]
+        _prune_stats["terms"].add(search_category)
+        _prune_stats["pruned"] += pruned
+        if stopped:
+            _prune_stats["stopped_terms"].add(search_category)
+    if is_new_term or pruned:
+        message = f"-> Price bound: listings costing over £{bound:.2f} can't beat CeX, {pruned} pruned"
+        print(message + (", rest of the term skipped." if stopped else "."))
+
+def prune_report():
+    with _prune_stats_lock:
+        terms, pruned, stopped_terms = len(_prune_stats["terms"]), _prune_stats["pruned"], len(_prune_stats["stopped_terms"])
+    if not terms:
+        return "Price bound: no terms had enough CeX history to prune."
+    return (
+        f"Price bound: {pruned} listings pruned over {terms} bounded terms, "
+        f"{stopped_terms} terms stopped early"
+    )
+
+def triage_items(items, search_category):
+    return list(iter_triaged_items(items, search_category))
+
+def iter_triaged_items(items, search_category):
+    index = get_seen_index()
+    counts = {"unchanged": 0, "rescored": 0, "process": 0}
+    for item in items:
+        item_id = parse_item_id(item['link'])
+        entry = index.get(item_id) if item_id is not None else None
+        search_price = item.get('search_price')
+        if entry is None or search_price is None:
+            outcome = "process"
+        elif entry['verdict'] == 'sold' or search_price == entry['price']:
+            index.touch(item_id)
+            outcome = "unchanged"
+        elif entry['verdict'] in ('profit', 'loss'):
+            rescore_item(item, entry, search_category)
+            outcome = "rescored"
+        else:
+            outcome = "process"
+        counts[outcome] += 1
+        if outcome == "process":
+            item['search_term'] = search_category
+            yield item
+    print(f"-> Seen index: {counts['unchanged']} unchanged listings skipped, {counts['rescored']} price changes re-scored, {counts['process']} to process.")
+
+def rescore_item(item, entry, search_category):
+    item['title'] = entry['title']
+    item['price'] = item['search_price']
+    item['postage'] = entry['postage'] if entry['postage'] is not None else 2.99
+    score_item(item, {"price": entry['cex_price'], "link": entry['cex_link']})
+
+    log_messages = [f"Re-scoring price change for {item['title']}: £{entry['price']:.2f} -> £{item['price']:.2f}"]
+    record_item_result(item, search_category, log_messages)
+    print("\n".join(log_messages))
+
+
+def load_vinted_page(driver, url):
+    with get_limiter("vinted.co.uk").slot() as slot, metrics.timer("vinted_page_load_seconds"):
+        driver.get(url)
+        if "You are rate limited" in driver.title:
+            slot.rate_limited()
+            return False
+    mode = "lean" if config.LEAN_BROWSER else "full"
+    metrics.increment("vinted_pages_total", mode=mode)
+    metrics.increment("vinted_page_bytes_total", page_transfer_bytes(driver), mode=mode)
+    return True
+
+def fetch_vinted_item(driver, item, log_messages):
+    if not load_vinted_page(driver, item['link']):
+        log_messages.append("!! Rate limited by Vinted. Requeueing item.")
+        metrics.increment("item_outcomes_total", outcome="rate_limited")
+        item['rate_limited'] = True
+        return False
+    handle_popups(driver)
+
+    page = snapshot_vinted_item_page(driver)
+    if page is not None:
+        if page.is_sold:
+            log_messages.append(f"-> Item is sold, skipping.")
+            record_sold_item(item)
+            return False
+        if page.is_complete:
+            apply_vinted_item_page(item, page, log_messages)
+            return True
+        log_messages.append("-> Page snapshot incomplete, falling back to element extraction.")
+
+    return fetch_vinted_item_from_elements(driver, item, log_messages)
+
+def record_sold_item(item):
+    item['verdict'] = "sold"
+    metrics.increment("item_outcomes_total", outcome="sold")
+    get_seen_index().record(item, "sold", item.get('search_term'))
+    get_result_store().record(item, item.get('search_term'))
+    checkpoint(item, "scored")
+
+def reached(item, state):
+    return STATES.index(item.get('state', STATES[0])) >= STATES.index(state)
+
+def checkpoint(item, state):
+    # Only listings taken from the work queue carry a state; watch mode and the pipeline don't checkpoint.
+    if 'state' in item:
+        get_work_queue().advance(item, state)
+
+def snapshot_vinted_item_page(driver):
     try:
-        thread_driver = get_driver()
-        
-        time.sleep(random.uniform(1, 4))
-        
-        thread_driver.get(item['link'])
-        handle_popups(thread_driver)
+        WebDriverWait(driver, 10).until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, "div.item-page-sidebar-content"))
+        )
+    except TimeoutException:
+        return None
+    return parse_vinted_item_html(driver.page_source)
+
+def apply_vinted_item_page(item, page, log_messages):
+    item['title'] = page.title
+    item['price'] = page.price
+    item['scraped_attributes'] = page.attributes
+    item['description'] = page.description
+    if page.price_source != 'page':
+        log_messages.append(f"-> Price taken from {page.price_source} data.")
+    if page.postage is None:
+        log_messages.append("-> Defaulting postage to £2.99 as it could not be extracted.")
+        item['postage'] = 2.99
+    else:
+        item['postage'] = page.postage
+
+def fetch_vinted_item_from_elements(driver, item, log_messages):
+    try:
+        driver.find_element(By.CSS_SELECTOR, "div[data-testid='item-status-banner']")
+        log_messages.append(f"-> Item is sold, skipping.")
+        record_sold_item(item)
+        return False
+    except NoSuchElementException:
+        pass
 
-        if "You are rate limited" in thread_driver.title:
-            log_messages.append("!! Rate limited by Vinted. Skipping item.")
-            print("\n".join(log_messages))
-            time.sleep(10)
-            return
-        
+    is_scraped = False
+    for attempt in range(2):
         try:
-            thread_driver.find_element(By.CSS_SELECTOR, "div[data-testid='item-status-banner']")
-            log_messages.append(f"-> Item is sold, skipping.")
-            print("\n".join(log_messages))
-            return
-        except NoSuchElementException:
-            pass
+            sidebar_content = WebDriverWait(driver, 10).until(
+                EC.presence_of_element_located((By.CSS_SELECTOR, "div.item-page-sidebar-content"))
+            )
+            title = sidebar_content.find_element(By.CSS_SELECTOR, "h1[class*='title']").text.strip()
 
-        is_scraped = False
-        for attempt in range(2):
             try:
-                sidebar_content = WebDriverWait(thread_driver, 10).until(
-                    EC.presence_of_element_located((By.CSS_SELECTOR, "div.item-page-sidebar-content"))
+                price_element = WebDriverWait(driver, 15).until(
+                    EC.presence_of_element_located((By.CSS_SELECTOR, "div[data-testid='item-price'] p"))
                 )
-                title = sidebar_content.find_element(By.CSS_SELECTOR, "h1[class*='title']").text.strip()
-                
-                try:
-                    price_element = WebDriverWait(thread_driver, 15).until(
-                        EC.presence_of_element_located((By.CSS_SELECTOR, "div[data-testid='item-price'] p"))
-                    )
-                    price_text = price_element.text
-                    if not price_text or not any(char.isdigit() for char in price_text):
-                        raise ValueError("Price text not found or invalid.")
-                    price = float(re.sub(r'[^\d.]', '', price_text))
-                except (TimeoutException, ValueError, NoSuchElementException):
-                    # Fallback to meta tag if UI extraction fails
-                    log_messages.append("-> Falling back to meta tag for price.")
-                    meta_price_element = WebDriverWait(thread_driver, 5).until(
-                        EC.presence_of_element_located((By.CSS_SELECTOR, "meta[property='product:price:amount']"))
-                    )
-                    price = float(meta_price_element.get_attribute("content"))
-
-                item['title'] = title
-                item['price'] = price
-                is_scraped = True
-                break
-            except (TimeoutException, ValueError, NoSuchElementException, StaleElementReferenceException) as e:
-                if attempt == 0:
-                    log_messages.append(f"!! Could not parse title/price, refreshing and retrying. Error: {type(e).__name__}")
-                    time.sleep(1)
-                    thread_driver.refresh()
-                    handle_popups(thread_driver)
-                    time.sleep(3)
-                else:
-                    log_messages.append(f"!! Failed to parse title/price after retrying. Skipping. Error: {type(e).__name__}")
-                    log_messages.append("--- DEBUG: Page source at failure ---")
-                    log_messages.append(thread_driver.page_source[:2000])
-                    log_messages.append("--- END DEBUG ---")
-                    print("\n".join(log_messages))
-                    return
-        
-        if not is_scraped:
-            print("\n".join(log_messages))
-            return
-
-        scraped_attributes, description = scrape_vinted_item_page(thread_driver)
-        item['scraped_attributes'] = scraped_attributes
-        item['description'] = description
+                price_text = price_element.text
+                if not price_text or not any(char.isdigit() for char in price_text):
+                    raise ValueError("Price text not found or invalid.")
+                price = float(re.sub(r'[^\d.]', '', price_text))
+            except (TimeoutException, ValueError, NoSuchElementException):
+                # Fallback to meta tag if UI extraction fails
+                log_messages.append("-> Falling back to meta tag for price.")
+                meta_price_element = WebDriverWait(driver, 5).until(
+                    EC.presence_of_element_located((By.CSS_SELECTOR, "meta[property='product:price:amount']"))
+                )
+                price = float(meta_price_element.get_attribute("content"))
 
-        postage = 'N/A'
-        try:
-            postage_selector = (By.CSS_SELECTOR, "h3[data-testid='item-shipping-banner-price']")
-            postage_element = WebDriverWait(thread_driver, 3).until(EC.presence_of_element_located(postage_selector))
-            postage_text = postage_element.text
-            match = re.search(r'£\s*(\d+(?:\.\d{2})?)', postage_text)
-            if match:
-                postage = float(match.group(1))
+            item['title'] = title
+            item['price'] = price
+            is_scraped = True
+            break
+        except (TimeoutException, ValueError, NoSuchElementException, StaleElementReferenceException) as e:
+            if attempt == 0:
+                log_messages.append(f"!! Could not parse title/price, refreshing and retrying. Error: {type(e).__name__}")
+                time.sleep(1)
+                driver.refresh()
+                handle_popups(driver)
+                time.sleep(3)
             else:
-                cleaned_postage = re.sub(r'[^\d.]', '', postage_text)
-                postage = float(cleaned_postage) if cleaned_postage else 2.99
-        except Exception:
-            log_messages.append("-> Defaulting postage to £2.99 as it could not be extracted.")
-            postage = 2.99
-            
-        item['postage'] = postage
+                log_messages.append(f"!! Failed to parse title/price after retrying. Skipping. Error: {type(e).__name__}")
+                metrics.increment("item_outcomes_total", outcome="parse_fail")
+                log_messages.append(f"-> {debug_note(capture_page(driver, 'vinted_item'))}.")
+                return False
 
-        clean_query = generate_cex_query_from_vinted_listing(item, search_category, log_messages)
-        cex_data = get_cex_buy_price(thread_driver, clean_query, item, log_messages)
+    if not is_scraped:
+        return False
 
-        postage_cost = item.get('postage')
-        if cex_data and isinstance(postage_cost, (int, float)):
-            cex_price = cex_data['price']
-            buyer_protection_fee = 0.70 + (item['price'] * 0.05)
-            total_vinted_cost = item['price'] + postage_cost + buyer_protection_fee
-            pnl = cex_price - total_vinted_cost
+    scraped_attributes, description = scrape_vinted_item_page(driver)
+    item['scraped_attributes'] = scraped_attributes
+    item['description'] = description
 
-            if pnl > 0:
-                log_messages.append(f"✅ PROFIT FOUND: £{pnl:.2f} for {item['title']}")
-                log_profit_detailed(item, cex_data, pnl, total_vinted_cost, search_category)
-            else:
-                log_messages.append(f"❌ Loss: £{abs(pnl):.2f} for {item['title']}")
+    postage = 'N/A'
+    try:
+        postage_selector = (By.CSS_SELECTOR, "h3[data-testid='item-shipping-banner-price']")
+        postage_element = WebDriverWait(driver, 3).until(EC.presence_of_element_located(postage_selector))
+        postage_text = postage_element.text
+        match = re.search(r'£\s*(\d+(?:\.\d{2})?)', postage_text)
+        if match:
+            postage = float(match.group(1))
         else:
-            log_messages.append(f"-> No deal for {item['title']} (No CeX price or postage info found).")
+            cleaned_postage = re.sub(r'[^\d.]', '', postage_text)
+            postage = float(cleaned_postage) if cleaned_postage else 2.99
+    except Exception:
+        log_messages.append("-> Defaulting postage to £2.99 as it could not be extracted.")
+        postage = 2.99
+
+    item['postage'] = postage
+    return True
+
+def evaluate_item(driver, item, clean_query, search_category, log_messages):
+    item['clean_query'] = clean_query
+    if not reached(item, "priced"):
+        with timed_stage(item, "cex"):
+            item['cex'] = get_cex_buy_price(driver, clean_query, item, log_messages)
+        checkpoint(item, "priced")
+    score_item(item, item['cex'])
+    record_item_result(item, search_category, log_messages)
+    checkpoint(item, "scored")
+
+def score_item(item, cex_data):
+    item['cex'] = cex_data
+    postage_cost = item.get('postage')
+    if cex_data and isinstance(postage_cost, (int, float)):
+        pnl, total_vinted_cost = calculate_pnl(cex_data['price'], item['price'], postage_cost)
+        item['buyer_protection_fee'] = buyer_protection_fee(item['price'])
+        item['pnl'] = pnl
+        item['total_vinted_cost'] = total_vinted_cost
+        item['verdict'] = "profit" if pnl > 0 else "loss"
+    else:
+        item['verdict'] = "no_match"
+
+def record_item_result(item, search_category, log_messages):
+    cex_data = item.get('cex')
+    if item['verdict'] == "profit":
+        log_messages.append(f"✅ PROFIT FOUND: £{item['pnl']:.2f} for {item['title']}")
+    elif item['verdict'] == "loss":
+        log_messages.append(f"❌ Loss: £{abs(item['pnl']):.2f} for {item['title']}")
+    elif item.get('lookup_failed'):
+        log_messages.append(f"-> No deal for {item['title']} yet: the CeX lookup failed, so it is checked again next run.")
+    else:
+        log_messages.append(f"-> No deal for {item['title']} (No CeX price or postage info found).")
+    if not (item['verdict'] == "no_match" and item.get('lookup_failed')):
+        get_seen_index().record(item, item['verdict'], search_category, cex_data, item.get('pnl'))
+    get_result_store().record(item, search_category)
+    metrics.increment("item_outcomes_total", outcome=item['verdict'])
+
+def process_item(item, search_category):
+    log_messages = [f"Processing link: {item['link']}"]
+    try:
+        thread_driver = get_driver()
+        if not reached(item, "fetched"):
+            with timed_stage(item, "fetch"):
+                is_fetched = fetch_vinted_item(thread_driver, item, log_messages)
+            if not is_fetched:
+                return
+            checkpoint(item, "fetched")
+
+        if not reached(item, "normalised"):
+            with timed_stage(item, "query"):
+                item['clean_query'] = generate_cex_query_from_vinted_listing(item, search_category, log_messages)
+            checkpoint(item, "normalised")
+        evaluate_item(thread_driver, item, item['clean_query'], search_category, log_messages)
 
     except (MaxRetryError, NewConnectionError) as e:
         log_messages.append(f"!! Network connection error: {type(e).__name__}. The driver for this thread may have crashed.")
@@ -391,3 +819,32 @@ def process_item(item, search_category):
         log_messages.append(f"!! An unexpected error occurred: {e}")
     finally:
         print("\n".join(log_messages))
+
+def fetch_item_for_batch(item):
+    log_messages = [f"Fetching link: {item['link']}"]
+    try:
+        with timed_stage(item, "fetch"):
+            is_fetched = fetch_vinted_item(get_driver(), item, log_messages)
+        if is_fetched:
+            checkpoint(item, "fetched")
+        return is_fetched
+    except (MaxRetryError, NewConnectionError) as e:
+        log_messages.append(f"!! Network connection error: {type(e).__name__}. The driver for this thread may have crashed.")
+        return False
+    except Exception as e:
+        log_messages.append(f"!! An unexpected error occurred: {e}")
+        return False
+    finally:
+        print("\n".join(log_messages))
+
+def evaluate_item_for_batch(item, clean_query, search_category):
+    log_messages = [f"Evaluating: {item['title']} ({item['link']})"]
+    try:
+        driver = get_driver() if config.CEX_BACKEND != 'api' else None
+        evaluate_item(driver, item, clean_query, search_category, log_messages)
+    except (MaxRetryError, NewConnectionError) as e:
+        log_messages.append(f"!! Network connection error: {type(e).__name__}. The driver for this thread may have crashed.")
+    except Exception as e:
+        log_messages.append(f"!! An unexpected error occurred: {e}")
+    finally:
+        print("\n".join(log_messages))
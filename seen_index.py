@@ -0,0 +1,142 @@
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+import config
+
+_index = None
+_index_lock = threading.Lock()
+
+# Verdicts that are final for a given price. Anything else (rate limited, parse failures, and
+# no_match after a failed lookup) is not recorded, so the listing is processed again on the next run.
+VERDICTS = ("sold", "no_match", "profit", "loss")
+
+def parse_item_id(link):
+    match = re.search(r'/items/(\d+)', link or "")
+    return int(match.group(1)) if match else None
+
+class SeenIndex:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS listings ("
+            "item_id INTEGER PRIMARY KEY, link TEXT NOT NULL, search_term TEXT, "
+            "title TEXT, price REAL, postage REAL, verdict TEXT NOT NULL, "
+            "cex_price REAL, cex_link TEXT, pnl REAL, last_seen REAL NOT NULL)"
+        )
+        # Highest listing id seen per watched search, so watch mode only processes newer listings.
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS watermarks (search_key TEXT PRIMARY KEY, item_id INTEGER NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, item_id):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM listings WHERE item_id = ?", (item_id,)).fetchone()
+        return dict(row) if row else None
+
+    def record(self, item, verdict, search_term, cex_data=None, pnl=None):
+        item_id = parse_item_id(item.get('link'))
+        if item_id is None or verdict not in VERDICTS:
+            return
+        postage = item.get('postage')
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO listings "
+                "(item_id, link, search_term, title, price, postage, verdict, cex_price, cex_link, pnl, last_seen) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    item_id,
+                    item['link'],
+                    search_term,
+                    item.get('title'),
+                    item.get('price'),
+                    postage if isinstance(postage, (int, float)) else None,
+                    verdict,
+                    cex_data['price'] if cex_data else None,
+                    cex_data['link'] if cex_data else None,
+                    pnl,
+                    time.time(),
+                ),
+            )
+            self._conn.commit()
+
+    def payout_history(self, search_term):
+        # Highest CeX cash price matched for this term, and how many matches it is drawn from.
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MAX(cex_price), COUNT(cex_price) FROM listings WHERE search_term = ?", (search_term,)
+            ).fetchone()
+        return row[0], row[1]
+
+    def scored_listings(self, since=None):
+        # Listings with a CeX match, for offline re-scoring.
+        with self._lock:
+            return self._conn.execute(
+                "SELECT item_id, link, search_term, title, price, postage, cex_price, cex_link FROM listings "
+                "WHERE verdict IN ('profit', 'loss') AND last_seen >= ? ORDER BY item_id",
+                (since or 0,),
+            ).fetchall()
+
+    def get_watermark(self, search_key):
+        with self._lock:
+            row = self._conn.execute("SELECT item_id FROM watermarks WHERE search_key = ?", (search_key,)).fetchone()
+        return row[0] if row else None
+
+    def set_watermark(self, search_key, item_id):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO watermarks (search_key, item_id, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(search_key) DO UPDATE SET item_id = MAX(item_id, excluded.item_id), updated_at = excluded.updated_at",
+                (search_key, item_id, time.time()),
+            )
+            self._conn.commit()
+
+    def touch(self, item_id):
+        with self._lock:
+            self._conn.execute("UPDATE listings SET last_seen = ? WHERE item_id = ?", (time.time(), item_id))
+            self._conn.commit()
+
+    def export_jsonl(self, path):
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM listings ORDER BY item_id").fetchall()
+        with open(path, "w", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(dict(row)) + "\n")
+        return len(rows)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def get_seen_index():
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = SeenIndex(config.SEEN_INDEX_PATH)
+        return _index
+
+def close_seen_index():
+    global _index
+    with _index_lock:
+        if _index is not None:
+            _index.close()
+            _index = None
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "export":
+        print("Usage: python seen_index.py export [output.jsonl]")
+        sys.exit(1)
+    output_path = sys.argv[2] if len(sys.argv) > 2 else "seen_listings.jsonl"
+    count = get_seen_index().export_jsonl(output_path)
+    print(f"Exported {count} listings to {output_path}")
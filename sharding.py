@@ -0,0 +1,80 @@
+import argparse
+import json
+import math
+import os
+import config
+from result_store import iter_results
+from seen_index import parse_item_id
+
+def shard_units(terms, shard_count):
+    # A unit is (term, part, parts): search the term and keep the listings whose id falls in the part.
+    # Terms are only split into parts when there are more shards than terms.
+    parts = max(1, math.ceil(shard_count / len(terms)))
+    return [(term, part, parts) for part in range(parts) for term in terms]
+
+def units_for_shard(terms, shard_index, shard_count):
+    if not 0 <= shard_index < shard_count:
+        raise ValueError(f"Shard index {shard_index} is out of range for {shard_count} shards.")
+    return shard_units(terms, shard_count)[shard_index::shard_count]
+
+def iter_partition(items, part, parts):
+    for item in items:
+        item_id = parse_item_id(item['link'])
+        if parts == 1 or (item_id or 0) % parts == part:
+            yield item
+
+def shard_path(name, shard_index, shard_count):
+    stem, extension = os.path.splitext(os.path.basename(name))
+    return os.path.join(config.SHARD_OUTPUT_DIR, f"{stem}.shard-{shard_index}-of-{shard_count}{extension}")
+
+def merge_key(record):
+    return record.get('item_id') or record.get('link')
+
+def pick_record(current, candidate):
+    # The same listing found under several terms: keep the most profitable evaluation, else the latest.
+    if (candidate.get('pnl') is None) != (current.get('pnl') is None):
+        return candidate if candidate.get('pnl') is not None else current
+    if candidate.get('pnl') is not None and candidate['pnl'] != current['pnl']:
+        return candidate if candidate['pnl'] > current['pnl'] else current
+    return candidate if candidate['recorded_at'] > current['recorded_at'] else current
+
+def merge_results(paths, output_path):
+    # Appends one record per listing to output_path, so merging into results.jsonl keeps its history.
+    merged = {}
+    terms = {}
+    total = 0
+    for path in paths:
+        for record in iter_results(path):
+            total += 1
+            key = merge_key(record)
+            terms.setdefault(key, set()).add(record.get('search_term'))
+            merged[key] = pick_record(merged[key], record) if key in merged else record
+
+    with open(output_path, "a", encoding="utf-8") as f:
+        for key, record in merged.items():
+            record['search_terms'] = sorted(term for term in terms[key] if term)
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    return total, len(merged)
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge the partial results written by sharded runs.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    merge_parser = subparsers.add_parser("merge", help="Combine shard result files, one record per listing, and append them to the output.")
+    merge_parser.add_argument("paths", nargs="+")
+    merge_parser.add_argument("--output", default=config.RESULTS_JSONL_PATH)
+    plan_parser = subparsers.add_parser("plan", help="Show which terms and parts each shard runs.")
+    plan_parser.add_argument("shard_count", type=int)
+    args = parser.parse_args()
+
+    if args.command == "merge":
+        total, unique = merge_results(args.paths, args.output)
+        print(f"Merged {total} results from {len(args.paths)} files into {unique} listings ({total - unique} duplicates removed), appended to {args.output}")
+    else:
+        for shard_index in range(args.shard_count):
+            units = units_for_shard(config.SEARCH_TERMS, shard_index, args.shard_count)
+            print(f"Shard {shard_index}: " + ", ".join(
+                term if parts == 1 else f"{term} (part {part + 1}/{parts})" for term, part, parts in units
+            ))
+
+if __name__ == "__main__":
+    main()
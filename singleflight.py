@@ -0,0 +1,93 @@
+import threading
+import time
+from collections import OrderedDict
+import config
+import metrics
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    # Concurrent calls with the same key share one execution. Finished results are memoised for up to
+    # ttl seconds, keeping the max_entries most recently used, so long watch runs stay bounded and fresh.
+    def __init__(self, name, memoize=None, ttl=None, max_entries=None):
+        self.name = name
+        self.memoize = memoize or (lambda result: True)
+        self.ttl = ttl
+        self.max_entries = max_entries if max_entries is not None else config.SINGLEFLIGHT_MEMO_MAX_ENTRIES
+        self.stats = {"lookups": 0, "in_flight": 0, "memo": 0}
+        self._calls = {}
+        self._memo = OrderedDict()
+        self._lock = threading.Lock()
+
+    def do(self, key, func):
+        # Returns (result, shared): shared is True when another caller's lookup answered this one.
+        with self._lock:
+            self.stats["lookups"] += 1
+            memoised = self._memo.get(key)
+            if memoised is not None and (memoised[1] is None or memoised[1] > time.monotonic()):
+                self._memo.move_to_end(key)
+                self.stats["memo"] += 1
+                metrics.increment("duplicate_lookups_total", lookup=self.name, source="memo")
+                return memoised[0], True
+            if memoised is not None:
+                del self._memo[key]
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.stats["in_flight"] += 1
+                metrics.increment("duplicate_lookups_total", lookup=self.name, source="in_flight")
+
+        if not is_leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                if call.error is None and self.memoize(call.result):
+                    self._memo[key] = (call.result, time.monotonic() + self.ttl if self.ttl else None)
+                    self._memo.move_to_end(key)
+                    while len(self._memo) > self.max_entries:
+                        self._memo.popitem(last=False)
+            call.done.set()
+        return call.result, False
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats)
+
+def get_flight(name, memoize=None, ttl=None):
+    with _flights_lock:
+        flight = _flights.get(name)
+        if flight is None:
+            flight = _flights[name] = SingleFlight(name, memoize, ttl)
+        return flight
+
+def singleflight_report():
+    with _flights_lock:
+        flights = list(_flights.values())
+    lines = []
+    for flight in flights:
+        stats = flight.snapshot()
+        duplicates = stats["in_flight"] + stats["memo"]
+        lines.append(
+            f"{flight.name}: {stats['lookups']} lookups, {duplicates} duplicates "
+            f"({stats['in_flight']} joined an in-flight request, {stats['memo']} answered from the run memo)"
+        )
+    return lines
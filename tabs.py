@@ -0,0 +1,233 @@
+import queue
+import threading
+import time
+from selenium.common.exceptions import WebDriverException
+import config
+import metrics
+from rate_limit import get_limiter
+from scraper import apply_vinted_item_page, record_sold_item, checkpoint
+from seen_index import parse_item_id
+from utils import block_unneeded_requests
+from vinted_parser import parse_vinted_item_html
+from debug_capture import capture_html, debug_note
+
+_DONE = object()
+
+# Marks the tab's current document before navigating away, so a page still showing the marker has
+# not been replaced yet.
+NAVIGATE_SCRIPT = "window.__tabNavigating = true; window.location.href = arguments[0];"
+
+# One round trip tells whether a tab has reached the listing it was sent to and has something to read.
+PAGE_STATE_SCRIPT = """
+return [
+    !window.__tabNavigating,
+    location.href,
+    document.readyState,
+    document.title,
+    !!document.querySelector('div.item-page-sidebar-content'),
+    !!document.querySelector("div[data-testid='item-status-banner']")
+];
+"""
+
+class TabScheduler:
+    # Drives several tabs of one Chrome: navigations are started without waiting, then the tabs are
+    # polled in turn and whichever finishes first is parsed and given the next listing.
+    def __init__(self, driver, tab_count):
+        self.driver = driver
+        self.handles = [driver.current_window_handle]
+        for _ in range(tab_count - 1):
+            driver.switch_to.new_window('tab')
+            if config.LEAN_BROWSER:
+                block_unneeded_requests(driver)
+            self.handles.append(driver.current_window_handle)
+        self.limiter = get_limiter("vinted.co.uk")
+        self.active = {}
+        self.next_item = None
+
+    def run(self, work, on_done):
+        finished = False
+        while not finished or self.active or self.next_item is not None:
+            for handle in self.handles:
+                if handle in self.active:
+                    continue
+                if self.next_item is None and not finished:
+                    try:
+                        # Only block for new work when no tab has a page loading.
+                        self.next_item = work.get(block=not self.active)
+                    except queue.Empty:
+                        break
+                    if self.next_item is _DONE:
+                        work.put(_DONE)
+                        finished = True
+                        self.next_item = None
+                if self.next_item is None:
+                    break
+                # The slots held by this browser's loading tabs are only released by polling them, so
+                # only wait for a free slot when none of its tabs is loading.
+                if not self.limiter.acquire(timeout=0 if self.active else None):
+                    break
+                self._start(handle, self.next_item)
+                self.next_item = None
+
+            progressed = False
+            for handle in list(self.active):
+                if self._poll(handle, on_done):
+                    progressed = True
+            if not progressed and self.active:
+                time.sleep(config.TAB_POLL_INTERVAL)
+
+    def abandon(self):
+        # After a failure: gives back the slots of the tabs still loading and returns the listings this
+        # browser took but did not finish.
+        items = [item for item, _ in self.active.values()]
+        for _ in self.active:
+            self.limiter.release("error")
+        self.active = {}
+        if self.next_item is not None:
+            items.append(self.next_item)
+            self.next_item = None
+        return items
+
+    def close(self):
+        for handle in self.handles[1:]:
+            try:
+                self.driver.switch_to.window(handle)
+                self.driver.close()
+            except WebDriverException:
+                pass
+        self.driver.switch_to.window(self.handles[0])
+
+    def _start(self, handle, item):
+        # Called holding a limiter slot, which _poll releases once the tab is registered.
+        try:
+            self.driver.switch_to.window(handle)
+            self.driver.execute_script(NAVIGATE_SCRIPT, item['link'])
+        except BaseException:
+            self.limiter.release("error")
+            raise
+        self.active[handle] = (item, time.perf_counter())
+
+    def _poll(self, handle, on_done):
+        item, started = self.active[handle]
+        elapsed = time.perf_counter() - started
+        is_rate_limited = False
+        try:
+            self.driver.switch_to.window(handle)
+            navigated, href, ready_state, title, has_sidebar, is_sold = self.driver.execute_script(PAGE_STATE_SCRIPT)
+            # The rate-limit page can be served from another URL, so it is recognised by its title alone.
+            is_rate_limited = navigated and "You are rate limited" in title
+            arrived = navigated and parse_item_id(href) == parse_item_id(item['link'])
+            if is_rate_limited:
+                item['rate_limited'] = True
+                html = None
+            elif arrived and (has_sidebar or is_sold or ready_state == "complete"):
+                html = self.driver.page_source
+            elif elapsed > config.TAB_PAGE_TIMEOUT:
+                html = None
+            else:
+                return False
+        except WebDriverException:
+            html = None
+
+        del self.active[handle]
+        self.limiter.release("rate_limited" if is_rate_limited else "ok" if html else "error")
+        item.setdefault('timings', {})['fetch'] = round(elapsed, 3)
+        metrics.observe("stage_seconds", elapsed, stage="fetch")
+        on_done(item, html)
+        return True
+
+def finish_item(item, html, log_messages):
+    page = parse_vinted_item_html(html) if html is not None else None
+    if item.get('rate_limited') or (page is not None and page.is_rate_limited):
+        log_messages.append("!! Rate limited by Vinted. Requeueing item.")
+        metrics.increment("item_outcomes_total", outcome="rate_limited")
+        item['rate_limited'] = True
+        return False
+    if page is None:
+        log_messages.append("!! Timed out waiting for the listing to load in its tab.")
+        metrics.increment("item_outcomes_total", outcome="parse_fail")
+        return False
+    if page.is_sold:
+        log_messages.append("-> Item is sold, skipping.")
+        record_sold_item(item)
+        return False
+    if not page.is_complete:
+        log_messages.append(f"!! Could not parse title/price from the page. Skipping. {debug_note(capture_html('vinted_item', item['link'], html))}.")
+        metrics.increment("item_outcomes_total", outcome="parse_fail")
+        return False
+    apply_vinted_item_page(item, page, log_messages)
+    checkpoint(item, "fetched")
+    return True
+
+def fetch_items_in_tabs(pool, items):
+    # Returns the listings that were fetched, retrying rate-limited ones in later rounds.
+    fetched = []
+    pending = items
+    for attempt in range(config.RATE_LIMIT_MAX_REQUEUES + 1):
+        round_items = []
+        unfinished = []
+        work = queue.Queue()
+        lock = threading.Lock()
+
+        def on_done(item, html):
+            log_messages = [f"Fetched in tab: {item['link']}"]
+            try:
+                is_fetched = finish_item(item, html, log_messages)
+            except Exception as e:
+                log_messages.append(f"!! Could not process the listing: {e}")
+                metrics.increment("item_outcomes_total", outcome="parse_fail")
+                is_fetched = False
+            finally:
+                print("\n".join(log_messages))
+            if is_fetched:
+                with lock:
+                    fetched.append(item)
+
+        def browser_worker():
+            # A browser that fails hands its unfinished listings to the next round; the other browsers
+            # keep taking work from the queue.
+            scheduler = None
+            try:
+                with pool.lease() as driver:
+                    scheduler = TabScheduler(driver, config.TABS_PER_BROWSER)
+                    try:
+                        scheduler.run(work, on_done)
+                    finally:
+                        scheduler.close()
+            except Exception as e:
+                print(f"!! A browser failed while fetching listings in tabs: {e}")
+                if scheduler is not None:
+                    with lock:
+                        unfinished.extend(scheduler.abandon())
+
+        threads = [threading.Thread(target=browser_worker) for _ in range(config.TAB_BROWSERS)]
+        for thread in threads:
+            thread.start()
+        for item in pending:
+            round_items.append(item)
+            work.put(item)
+        work.put(_DONE)
+        for thread in threads:
+            thread.join()
+        # Left in the queue when every browser failed.
+        while not work.empty():
+            item = work.get()
+            if item is not _DONE:
+                unfinished.append(item)
+
+        rate_limited = [item for item in round_items if item.pop('rate_limited', False)]
+        pending = rate_limited + unfinished
+        if not pending:
+            break
+        if attempt < config.RATE_LIMIT_MAX_REQUEUES:
+            if rate_limited:
+                print(f"Requeueing {len(rate_limited)} rate-limited items...")
+            if unfinished:
+                print(f"Requeueing {len(unfinished)} items whose browser failed...")
+        else:
+            if rate_limited:
+                print(f"Dropping {len(rate_limited)} items that stayed rate limited.")
+            if unfinished:
+                print(f"Dropping {len(unfinished)} items whose browser kept failing.")
+                metrics.increment("item_outcomes_total", len(unfinished), outcome="parse_fail")
+    return fetched
@@ -1,13 +1,14 @@
-import requests
+import sys
+import config
+from cex_api import search_boxes, close_http_client
 
-query = "Hogwarts Legacy PS5"
-url = f"https://wss2.cex.uk.webuy.io/v3/boxes?q={query}"
-response = requests.get(url)
-print(response.status_code)
-if response.status_code == 200:
-    data = response.json()
-    boxes = data.get('response', {}).get('data', {}).get('boxes', [])
-    for box in boxes[:2]:
-        print(f"Name: {box.get('boxName')}")
-        print(f"Cash price: £{box.get('cashPrice')}")
-        print(f"Sell price: £{box.get('sellPrice')}")
+# Point CEX_API_URL at a local stub server to run this without hitting CeX.
+query = sys.argv[1] if len(sys.argv) > 1 else "Hogwarts Legacy PS5"
+print(f"Querying {config.CEX_API_URL} for '{query}'")
+try:
+    for result in search_boxes(query, count=2):
+        print(f"Name: {result['title']}")
+        print(f"Cash price: £{result['price']:.2f}")
+        print(f"Link: {result['link']}")
+finally:
+    close_http_client()
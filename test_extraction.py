@@ -1,3 +1,4 @@
+import os
 import sys
 import time
 from selenium import webdriver
@@ -5,12 +6,27 @@ from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
 import scraper
 import utils
+from vinted_parser import parse_vinted_item_html
+from debug_capture import read_snapshot
 
 def main():
     if len(sys.argv) > 1:
         test_link = sys.argv[1]
     else:
         test_link = 'https://www.vinted.co.uk/items/3588961726-ps5-hogwarts-legacy'
+
+    # A saved HTML file (e.g. fixtures/vinted_item.html, or a page saved in debug_pages/) is parsed offline without a browser.
+    if os.path.isfile(test_link):
+        start_time = time.time()
+        if test_link.endswith(".gz"):
+            html = read_snapshot(test_link)
+        else:
+            with open(test_link, encoding="utf-8") as f:
+                html = f.read()
+        page = parse_vinted_item_html(html)
+        print(page)
+        print(f"\nTime taken: {(time.time() - start_time) * 1000:.2f} ms")
+        return
         
     print(f"Testing extraction on Vinted item: {test_link}")
     
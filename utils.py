@@ -1,17 +1,66 @@
 import os
 import shutil
 import threading
-from datetime import datetime
+import time
+from contextlib import contextmanager
 from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
+from urllib3.exceptions import MaxRetryError, NewConnectionError
 import config
+import metrics
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
 
 thread_local = threading.local()
+_fallback_pool = None
 _drivers_for_cleanup = []
 _paths_for_cleanup = []
 driver_lock = threading.Lock()
-log_lock = threading.Lock()
+
+def create_chrome_driver(profile_path):
+    options = Options()
+    options.add_argument(f"user-data-dir={profile_path}")
+    options.add_argument("profile-directory=Default")
+    options.add_argument("--headless")
+    options.add_argument("--log-level=3")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument("--disable-blink-features=AutomationControlled")
+    if config.LEAN_BROWSER:
+        options.page_load_strategy = "eager"
+        options.add_argument(f"window-size={config.LEAN_WINDOW_SIZE}")
+    else:
+        options.add_argument("window-size=1920,1080")
+    options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/108.0.0.0 Safari/537.36")
+    options.add_experimental_option("excludeSwitches", ["enable-automation"])
+    options.add_experimental_option('useAutomationExtension', False)
+
+    service = Service()
+    with metrics.timer("driver_create_seconds"):
+        driver = webdriver.Chrome(service=service, options=options)
+    if config.LEAN_BROWSER:
+        block_unneeded_requests(driver)
+    return driver
+
+def block_unneeded_requests(driver):
+    driver.execute_cdp_cmd("Network.enable", {})
+    driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": config.LEAN_BLOCKED_URL_PATTERNS})
+
+def page_transfer_bytes(driver):
+    # Bytes fetched over the network for the current page, from the Resource Timing API.
+    try:
+        return driver.execute_script(
+            "const entries = performance.getEntriesByType('navigation').concat(performance.getEntriesByType('resource'));"
+            "return entries.reduce((total, entry) => total + (entry.transferSize || 0), 0);"
+        ) or 0
+    except WebDriverException:
+        return 0
 
 def get_driver():
     driver = getattr(thread_local, 'driver', None)
@@ -19,22 +68,7 @@ def get_driver():
         thread_id = threading.get_ident()
         unique_profile_path = f"{config.CHROME_PROFILE_PATH}-{thread_id}"
 
-        options = Options()
-        options.add_argument(f"user-data-dir={unique_profile_path}")
-        options.add_argument("profile-directory=Default")
-        options.add_argument("--headless")
-        options.add_argument("--log-level=3")
-        options.add_argument("--disable-gpu")
-        options.add_argument("--no-sandbox")
-        options.add_argument("--disable-dev-shm-usage")
-        options.add_argument("--disable-blink-features=AutomationControlled")
-        options.add_argument("window-size=1920,1080")
-        options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/108.0.0.0 Safari/537.36")
-        options.add_experimental_option("excludeSwitches", ["enable-automation"])
-        options.add_experimental_option('useAutomationExtension', False)
-        
-        service = Service()
-        driver = webdriver.Chrome(service=service, options=options)
+        driver = create_chrome_driver(unique_profile_path)
         setattr(thread_local, 'driver', driver)
         
         with driver_lock:
@@ -42,6 +76,171 @@ def get_driver():
             _paths_for_cleanup.append(unique_profile_path)
     return driver
 
+def set_fallback_pool(pool):
+    global _fallback_pool
+    _fallback_pool = pool
+
+@contextmanager
+def lease_fallback_driver(driver=None):
+    # For work that normally runs without a browser, like the CeX API lookups: the given driver or the
+    # thread's current one, else a driver leased from the run's pool for just this block, else None.
+    driver = driver or getattr(thread_local, 'driver', None)
+    if driver is not None or _fallback_pool is None:
+        yield driver
+    else:
+        with _fallback_pool.lease() as leased_driver:
+            yield leased_driver
+
+def driver_rss_mb(driver):
+    if psutil is None:
+        return None
+    try:
+        process = psutil.Process(driver.service.process.pid)
+        processes = [process] + process.children(recursive=True)
+        return sum(p.memory_info().rss for p in processes) / (1024 * 1024)
+    except (psutil.Error, AttributeError):
+        return None
+
+def process_exists(pid):
+    if psutil is not None:
+        return psutil.pid_exists(pid)
+    if os.name != "posix":
+        # os.kill would terminate the process on Windows, so assume it is alive.
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def remove_stale_profiles():
+    # Pool profiles are named after the process that created them; a run that was killed leaves its profiles behind.
+    parent = os.path.dirname(os.path.abspath(config.CHROME_PROFILE_PATH))
+    prefix = os.path.basename(config.CHROME_PROFILE_PATH) + "-pool-"
+    removed = 0
+    for name in os.listdir(parent) if os.path.isdir(parent) else []:
+        pid = name[len(prefix):].split("-")[0]
+        if name.startswith(prefix) and pid.isdigit() and int(pid) != os.getpid() and not process_exists(int(pid)):
+            shutil.rmtree(os.path.join(parent, name), ignore_errors=True)
+            removed += 1
+    return removed
+
+class DriverPool:
+    def __init__(self, size, max_pages=None, max_rss_mb=None):
+        self.size = size
+        self.max_pages = max_pages if max_pages is not None else config.DRIVER_MAX_PAGES
+        self.max_rss_mb = max_rss_mb if max_rss_mb is not None else config.DRIVER_MAX_RSS_MB
+        self._idle = []
+        self._pages = {}
+        self._profiles = {}
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+        self._closed = False
+        self._next_id = 0
+        self.metrics = {"created": 0, "recycled": 0, "unhealthy": 0, "checkouts": 0, "in_use": 0, "peak_rss_mb": 0.0}
+
+    def checkout(self):
+        self._slots.acquire()
+        try:
+            driver = self._take_healthy_idle() or self._create()
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self.metrics["checkouts"] += 1
+            self.metrics["in_use"] += 1
+        return driver
+
+    def checkin(self, driver):
+        with self._lock:
+            self.metrics["in_use"] -= 1
+            self._pages[driver] += 1
+            pages = self._pages[driver]
+        try:
+            rss_mb = driver_rss_mb(driver) if self.max_rss_mb else None
+            if rss_mb is not None:
+                with self._lock:
+                    self.metrics["peak_rss_mb"] = max(self.metrics["peak_rss_mb"], rss_mb)
+            if self._closed or pages >= self.max_pages or (rss_mb is not None and rss_mb > self.max_rss_mb):
+                if not self._closed:
+                    with self._lock:
+                        self.metrics["recycled"] += 1
+                self._destroy(driver)
+            else:
+                with self._lock:
+                    self._idle.append(driver)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def lease(self):
+        driver = self.checkout()
+        previous = getattr(thread_local, 'driver', None)
+        thread_local.driver = driver
+        try:
+            yield driver
+        finally:
+            thread_local.driver = previous
+            self.checkin(driver)
+
+    def run(self, func, *args, **kwargs):
+        with self.lease():
+            return func(*args, **kwargs)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.metrics, idle=len(self._idle), size=self.size)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for driver in idle:
+            self._destroy(driver)
+
+    def _take_healthy_idle(self):
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return None
+                driver = self._idle.pop()
+            if self._is_healthy(driver):
+                return driver
+            with self._lock:
+                self.metrics["unhealthy"] += 1
+            self._destroy(driver)
+
+    def _is_healthy(self, driver):
+        try:
+            driver.execute_script("return 1")
+            return True
+        except (WebDriverException, MaxRetryError, NewConnectionError, OSError):
+            return False
+
+    def _create(self):
+        with self._lock:
+            self._next_id += 1
+            profile_path = f"{config.CHROME_PROFILE_PATH}-pool-{os.getpid()}-{self._next_id}"
+        driver = create_chrome_driver(profile_path)
+        with self._lock:
+            self._pages[driver] = 0
+            self._profiles[driver] = profile_path
+            self.metrics["created"] += 1
+        return driver
+
+    def _destroy(self, driver):
+        try:
+            driver.quit()
+        except Exception:
+            pass
+        with self._lock:
+            self._pages.pop(driver, None)
+            profile_path = self._profiles.pop(driver, None)
+        if profile_path:
+            shutil.rmtree(profile_path, ignore_errors=True)
+
 def cleanup_drivers():
     global _drivers_for_cleanup, _paths_for_cleanup
     with driver_lock:
@@ -63,39 +262,12 @@ def cleanup_drivers():
         _paths_for_cleanup = []
 
 
-def log_profit_detailed(item, cex_data, pnl, total_vinted_cost, search_category):
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    
-    postage_cost = item.get('postage')
-    postage_str = f"£{postage_cost:.2f}" if isinstance(postage_cost, (int, float)) else "N/A"
-
-    scraped_attrs_str = ""
-    scraped_attrs = item.get('scraped_attributes', {})
-    if scraped_attrs:
-        for attr_key, attr_value in scraped_attrs.items():
-            scraped_attrs_str += f"      - {attr_key}: {attr_value}\n"
-    if not scraped_attrs_str:
-        scraped_attrs_str = "      (No additional attributes found)\n"
-
-    description_output = ""
-    if item.get('description'):
-        description_output = f"  -> Description: {item['description'][:100]}...\n"
-
-    log_entry = f"""
---- Potential Profit Found [{timestamp}] ---
-Search Category: {search_category}
-Vinted item: {item['title']}
-  -> Price: £{item['price']:.2f}, Postage: {postage_str}
-  -> Link to buy: {item['link']}
-  -> Scraped Attributes:
-{scraped_attrs_str.strip()}
-{description_output.strip()}
-  -> CeX webuy price: £{cex_data['price']:.2f}
-  -> CeX sell page: {cex_data['link']}
-  -> Total Vinted cost (inc. fees): ~£{total_vinted_cost:.2f}
-  ✅ Potential profit: £{pnl:.2f}
-------------------------------------
-"""
-    with log_lock:
-        with open(config.PROFIT_LOG_FILE, "a", encoding="utf-8") as f:
-            f.write(log_entry)
+@contextmanager
+def timed_stage(item, stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        item.setdefault('timings', {})[stage] = round(elapsed, 3)
+        metrics.observe("stage_seconds", elapsed, stage=stage)
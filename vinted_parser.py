@@ -0,0 +1,182 @@
+import json
+import re
+from dataclasses import dataclass, field
+from html.parser import HTMLParser
+from typing import Optional
+
+SINGLE_VALUED_FIELDS = {"title", "price", "description", "postage", "page_title"}
+
+LINE_BREAK = "\x00"
+
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+
+@dataclass
+class VintedItemPage:
+    title: Optional[str] = None
+    price: Optional[float] = None
+    price_source: Optional[str] = None
+    attributes: dict = field(default_factory=dict)
+    description: str = ""
+    postage: Optional[float] = None
+    is_sold: bool = False
+    is_rate_limited: bool = False
+
+    @property
+    def is_complete(self):
+        return bool(self.title) and self.price is not None
+
+class _VintedItemHTMLParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.stack = []
+        self.texts = {}
+        self.meta = {}
+        self.json_ld = []
+        self.attribute_rows = []
+        self.is_sold = False
+
+    def handle_starttag(self, tag, attrs):
+        attrs = {key: value or "" for key, value in attrs}
+        if tag == "meta":
+            key = attrs.get("property") or attrs.get("name")
+            if key and key not in self.meta:
+                self.meta[key] = attrs.get("content", "")
+            return
+        if tag == "br":
+            self.handle_data(LINE_BREAK)
+            return
+        if tag in VOID_TAGS:
+            return
+
+        context = set(self.stack[-1][1]) if self.stack else set()
+        classes = attrs.get("class", "").split()
+        test_id = attrs.get("data-testid")
+
+        if "item-page-sidebar-content" in classes:
+            context.add("sidebar")
+        if test_id == "item-price":
+            context.add("price")
+        if test_id == "item-status-banner":
+            self.is_sold = True
+        if "details-list__item" in classes:
+            self.attribute_rows.append([])
+            context.add("attribute_row")
+        if "details-list__item-value" in classes or "details-list__item-title" in classes:
+            context.add("attribute_cell")
+
+        capture = None
+        if tag == "h1" and "sidebar" in context and any("title" in c for c in classes):
+            capture = "title"
+        elif tag == "p" and "price" in context:
+            capture = "price"
+        elif attrs.get("itemprop") == "description":
+            capture = "description"
+        elif test_id == "item-shipping-banner-price":
+            capture = "postage"
+        elif tag == "span" and "attribute_cell" in context and "attribute_row" in context:
+            capture = "attribute"
+        elif tag == "script" and attrs.get("type") == "application/ld+json":
+            capture = "json_ld"
+        elif tag == "title":
+            capture = "page_title"
+
+        # Only the first occurrence of a single-valued field is kept.
+        if capture in SINGLE_VALUED_FIELDS and (capture in self.texts or self._is_capturing(capture)):
+            capture = None
+
+        self.stack.append((tag, context, (capture, []) if capture else None))
+
+    def _is_capturing(self, key):
+        return any(frame[2] and frame[2][0] == key for frame in self.stack)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS and self.stack and self.stack[-1][0] == tag:
+            self._pop_frame()
+
+    def handle_endtag(self, tag):
+        if not any(frame[0] == tag for frame in self.stack):
+            return
+        while self.stack:
+            popped_tag = self.stack[-1][0]
+            self._pop_frame()
+            if popped_tag == tag:
+                break
+
+    def handle_data(self, data):
+        for _, _, capture in self.stack:
+            if capture:
+                capture[1].append(data)
+
+    def _pop_frame(self):
+        _, _, capture = self.stack.pop()
+        if not capture:
+            return
+        key, parts = capture
+        if key == "json_ld":
+            self.json_ld.append("".join(parts))
+            return
+        # Source whitespace is collapsed like WebElement.text; only <br> produces a line break.
+        lines = (" ".join(line.split()) for line in "".join(parts).split(LINE_BREAK))
+        text = "\n".join(line for line in lines if line)
+        if key == "attribute":
+            if self.attribute_rows and text:
+                self.attribute_rows[-1].append(text)
+        elif key not in self.texts:
+            self.texts[key] = text
+
+def parse_price(text):
+    if not text or not any(char.isdigit() for char in text):
+        return None
+    match = re.search(r'(\d+(?:[.,]\d{1,2})?)', text.replace(",", ""))
+    return float(match.group(1)) if match else None
+
+def _json_ld_products(raw_blocks):
+    for raw in raw_blocks:
+        try:
+            data = json.loads(raw)
+        except ValueError:
+            continue
+        candidates = data if isinstance(data, list) else data.get("@graph", [data]) if isinstance(data, dict) else []
+        for candidate in candidates:
+            if isinstance(candidate, dict) and candidate.get("@type") == "Product":
+                yield candidate
+
+def parse_vinted_item_html(html):
+    parser = _VintedItemHTMLParser()
+    parser.feed(html)
+    parser.close()
+
+    page = VintedItemPage(is_sold=parser.is_sold)
+    page.is_rate_limited = "You are rate limited" in parser.texts.get("page_title", "")
+
+    product = next(_json_ld_products(parser.json_ld), {})
+    offers = product.get("offers") or {}
+    if isinstance(offers, list):
+        offers = offers[0] if offers else {}
+
+    page.title = parser.texts.get("title") or product.get("name") or parser.meta.get("og:title")
+
+    for source, text in (
+        ("page", parser.texts.get("price")),
+        ("meta", parser.meta.get("product:price:amount")),
+        ("json_ld", str(offers.get("price", ""))),
+    ):
+        price = parse_price(text)
+        if price is not None:
+            page.price = price
+            page.price_source = source
+            break
+
+    for row in parser.attribute_rows:
+        if len(row) >= 2:
+            page.attributes[row[0]] = row[-1]
+
+    page.description = parser.texts.get("description") or product.get("description") or ""
+
+    postage_text = parser.texts.get("postage")
+    if postage_text:
+        match = re.search(r'£\s*(\d+(?:\.\d{2})?)', postage_text)
+        page.postage = float(match.group(1)) if match else parse_price(postage_text)
+
+    return page
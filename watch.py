@@ -0,0 +1,133 @@
+import concurrent.futures
+import threading
+import time
+import httpx
+import config
+from scraper import iter_vinted_search_results, iter_price_bounded_items, iter_triaged_items, process_item
+from seen_index import get_seen_index, parse_item_id
+from sharding import iter_partition
+from cex_api import get_http_client
+
+def watermark_key(unit):
+    term, part, parts = unit
+    return term if parts == 1 else f"{term}#{part + 1}/{parts}"
+
+def iter_new_listings(search_results, watermark):
+    old_in_a_row = 0
+    for item in search_results:
+        item_id = parse_item_id(item['link'])
+        if item_id is None:
+            continue
+        if watermark is not None and item_id <= watermark:
+            old_in_a_row += 1
+            if old_in_a_row >= config.WATCH_OLD_LISTINGS_BEFORE_STOP:
+                return
+            continue
+        old_in_a_row = 0
+        yield item
+
+def emit_hit(item, term):
+    detect_seconds = time.time() - item['discovered_at']
+    uploaded = item.get('scraped_attributes', {}).get('Uploaded', 'unknown')
+    message = (
+        f"PROFIT £{item['pnl']:.2f}: {item['title']} for £{item['price']:.2f} ({term}), "
+        f"CeX pays £{item['cex']['price']:.2f}. {item['link']} "
+        f"(uploaded {uploaded}, processed {detect_seconds:.0f}s after it appeared)"
+    )
+    print(f"\n{'!' * 20}\n🔔 {message}\n{'!' * 20}\n")
+    if config.WATCH_WEBHOOK_URL:
+        try:
+            get_http_client().post(config.WATCH_WEBHOOK_URL, json={"text": message, "content": message}).raise_for_status()
+        except httpx.HTTPError as e:
+            print(f"!! Could not post hit to the webhook: {e}")
+
+class Watcher:
+    def __init__(self, units, pool):
+        self.units = units
+        self.pool = pool
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=config.MAX_WORKERS)
+        self.next_poll = {unit: 0.0 for unit in units}
+        self.retry = {unit: [] for unit in units}
+        self.stats = {"polls": 0, "new": 0, "processed": 0, "hits": 0}
+        self._stats_lock = threading.Lock()
+
+    def run(self, duration_seconds=None):
+        deadline = time.monotonic() + duration_seconds if duration_seconds else None
+        print(f"Watching {len(self.units)} searches every {config.WATCH_INTERVAL_SECONDS}s. Press Ctrl+C to stop.")
+        try:
+            while deadline is None or time.monotonic() < deadline:
+                unit = min(self.next_poll, key=self.next_poll.get)
+                wait = self.next_poll[unit] - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait if deadline is None else min(wait, max(deadline - time.monotonic(), 0)))
+                    continue
+                try:
+                    self.poll(unit)
+                except Exception as e:
+                    print(f"!! Watch poll for '{unit[0]}' failed: {e}")
+                self.next_poll[unit] = time.monotonic() + config.WATCH_INTERVAL_SECONDS
+        except KeyboardInterrupt:
+            print("\nStopping watch mode, waiting for listings in progress...")
+        finally:
+            self.executor.shutdown(wait=True)
+            print(self.report())
+
+    def poll(self, unit):
+        term, part, parts = unit
+        index = get_seen_index()
+        key = watermark_key(unit)
+        watermark = index.get_watermark(key)
+        discovered_at = time.time()
+        with self.pool.lease() as driver:
+            search_results = iter_vinted_search_results(
+                driver, term, num_items_to_check=config.WATCH_MAX_ITEMS_PER_POLL, order="newest_first"
+            )
+            new_items = list(iter_partition(iter_new_listings(search_results, watermark), part, parts))
+
+        if new_items:
+            index.set_watermark(key, max(parse_item_id(item['link']) for item in new_items))
+        with self._stats_lock:
+            self.stats["polls"] += 1
+        if watermark is None and not config.WATCH_BACKFILL:
+            print(f"-> Watch: '{term}' high-water mark set from {len(new_items)} current listings.")
+            return
+        with self._stats_lock:
+            self.stats["new"] += len(new_items)
+
+        with self._stats_lock:
+            retry, self.retry[unit] = self.retry[unit], []
+        print(f"-> Watch: {len(new_items)} new listings for '{term}'" + (f", retrying {len(retry)} rate-limited." if retry else "."))
+        items = iter_price_bounded_items(new_items, term, order="newest_first")
+        for item in list(iter_triaged_items(items, term)) + retry:
+            item.setdefault('discovered_at', discovered_at)
+            self.executor.submit(self.process, item, unit)
+
+    def process(self, item, unit):
+        term = unit[0]
+        try:
+            self.pool.run(process_item, item, term)
+        except Exception as e:
+            print(f"!! Watch: processing {item['link']} failed: {e}")
+            return
+        if item.pop('rate_limited', False):
+            # Retried on the next poll of this search, after the Vinted limiter has backed off.
+            with self._stats_lock:
+                self.retry[unit].append(item)
+            return
+        with self._stats_lock:
+            self.stats["processed"] += 1
+            if item.get('verdict') == "profit":
+                self.stats["hits"] += 1
+        if item.get('verdict') == "profit":
+            emit_hit(item, term)
+
+    def report(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+        return (
+            f"Watch mode: {stats['polls']} polls, {stats['new']} new listings, "
+            f"{stats['processed']} processed, {stats['hits']} profitable"
+        )
+
+def run_watch(units, pool, duration_seconds=None):
+    Watcher(units, pool).run(duration_seconds)
@@ -0,0 +1,234 @@
+import json
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import config
+from seen_index import parse_item_id
+from utils import process_exists
+
+_queue = None
+_queue_lock = threading.Lock()
+
+# A listing's state is the last stage whose result was committed. "scored" is final, including
+# listings that turned out to be sold.
+STATES = ("discovered", "fetched", "normalised", "priced", "scored")
+
+class WorkQueue:
+    # Search units and listings of the current run, checkpointed per stage. Shards share the file:
+    # each records its own units, and listings are leased so two live runs never work on the same one.
+    # A listing is queued once per unit that finds it; once one unit has scored it, the seen index
+    # keeps later units from processing it again.
+    def __init__(self, path):
+        self.path = path
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # Commits survive the process being killed; only a power cut can lose the last few.
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS units ("
+            "shard TEXT NOT NULL, position INTEGER NOT NULL, term TEXT NOT NULL, part INTEGER NOT NULL, "
+            "parts INTEGER NOT NULL, searched INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (term, part, parts))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS items ("
+            "term TEXT NOT NULL, part INTEGER NOT NULL, parts INTEGER NOT NULL, item_id INTEGER NOT NULL, "
+            "state TEXT NOT NULL, data TEXT NOT NULL, lease_owner TEXT, lease_expires REAL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, updated_at REAL NOT NULL, PRIMARY KEY (term, part, parts, item_id))"
+        )
+        self._conn.commit()
+
+    def start_run(self, units, shard):
+        # Forgets the shard's previous run. Finished listings are already in the seen index and result store.
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            for unit in set(self._shard_units(shard)) | set(units):
+                self._conn.execute("DELETE FROM items WHERE term = ? AND part = ? AND parts = ?", unit)
+            self._conn.execute("DELETE FROM units WHERE shard = ?", (shard,))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO units (shard, position, term, part, parts) VALUES (?, ?, ?, ?, ?)",
+                [(shard, position, term, part, parts) for position, (term, part, parts) in enumerate(units)],
+            )
+            self._conn.commit()
+
+    def resume_units(self, shard):
+        with self._lock:
+            return self._shard_units(shard)
+
+    def is_searched(self, unit):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT searched FROM units WHERE term = ? AND part = ? AND parts = ?", unit
+            ).fetchone()
+        return bool(row and row[0])
+
+    def mark_searched(self, unit):
+        with self._lock:
+            self._conn.execute("UPDATE units SET searched = 1 WHERE term = ? AND part = ? AND parts = ?", unit)
+            self._conn.commit()
+
+    def iter_enqueued(self, items, unit, search_status):
+        # Records each listing as discovered before yielding it, skipping ones this run already queued.
+        # The unit counts as searched once the search results are exhausted, unless the search page was
+        # rate limited, so --resume searches it again.
+        for item in items:
+            if self.enqueue(item, unit):
+                yield item
+        if not search_status.get('rate_limited'):
+            self.mark_searched(unit)
+
+    def enqueue(self, item, unit):
+        item_id = parse_item_id(item['link'])
+        if item_id is None:
+            return False
+        item['state'] = "discovered"
+        item['queue_unit'] = tuple(unit)
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO items "
+                "(term, part, parts, item_id, state, data, lease_owner, lease_expires, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (*unit, item_id, item['state'], self._dump(item), self.owner, now + config.WORK_QUEUE_LEASE_SECONDS, now),
+            )
+            self._conn.commit()
+        return cursor.rowcount == 1
+
+    def advance(self, item, state):
+        # Commits a finished stage and renews the lease; the final stage gives the listing up.
+        item['state'] = state
+        now = time.time()
+        is_final = state == STATES[-1]
+        with self._lock:
+            self._conn.execute(
+                "UPDATE items SET state = ?, data = ?, lease_owner = ?, lease_expires = ?, updated_at = ? "
+                "WHERE term = ? AND part = ? AND parts = ? AND item_id = ?",
+                (
+                    state,
+                    self._dump(item),
+                    None if is_final else self.owner,
+                    None if is_final else now + config.WORK_QUEUE_LEASE_SECONDS,
+                    now,
+                    *item['queue_unit'],
+                    parse_item_id(item['link']),
+                ),
+            )
+            self._conn.commit()
+
+    def lease_pending(self, unit):
+        # Unfinished listings of the unit that no live run holds, leased to this one.
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._reclaim_stale_leases()
+            rows = self._conn.execute(
+                "SELECT item_id, state, data FROM items "
+                "WHERE term = ? AND part = ? AND parts = ? AND state != ? AND attempts < ? "
+                "AND (lease_owner IS NULL OR lease_expires < ?) ORDER BY updated_at",
+                (*unit, STATES[-1], config.WORK_QUEUE_MAX_ATTEMPTS, now),
+            ).fetchall()
+            self._conn.executemany(
+                "UPDATE items SET lease_owner = ?, lease_expires = ? WHERE term = ? AND part = ? AND parts = ? AND item_id = ?",
+                [(self.owner, now + config.WORK_QUEUE_LEASE_SECONDS, *unit, row['item_id']) for row in rows],
+            )
+            self._conn.commit()
+        items = []
+        for row in rows:
+            item = json.loads(row['data'])
+            item['state'] = row['state']
+            item['queue_unit'] = tuple(unit)
+            items.append(item)
+        return items
+
+    def release_leases(self):
+        # Called when a run ends: listings it left unfinished count as a failed attempt.
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE items SET lease_owner = NULL, lease_expires = NULL, attempts = attempts + 1 "
+                "WHERE lease_owner = ?",
+                (self.owner,),
+            )
+            self._conn.commit()
+        return cursor.rowcount
+
+    def progress(self, shard=None):
+        # Listing counts per state, and how many units are still to be searched.
+        with self._lock:
+            units = self._shard_units(shard) if shard is not None else [
+                tuple(row) for row in self._conn.execute("SELECT term, part, parts FROM units").fetchall()
+            ]
+            counts = dict.fromkeys(STATES, 0)
+            unsearched = 0
+            for unit in units:
+                for state, count in self._conn.execute(
+                    "SELECT state, COUNT(*) FROM items WHERE term = ? AND part = ? AND parts = ? GROUP BY state", unit
+                ):
+                    counts[state] += count
+                row = self._conn.execute(
+                    "SELECT searched FROM units WHERE term = ? AND part = ? AND parts = ?", unit
+                ).fetchone()
+                unsearched += not row[0]
+        return counts, unsearched, len(units)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _shard_units(self, shard):
+        rows = self._conn.execute(
+            "SELECT term, part, parts FROM units WHERE shard = ? ORDER BY position", (shard,)
+        ).fetchall()
+        return [tuple(row) for row in rows]
+
+    def _reclaim_stale_leases(self):
+        # Leases held by processes on this machine that no longer exist are released straight away,
+        # instead of waiting for them to expire.
+        host = socket.gethostname()
+        owners = self._conn.execute("SELECT DISTINCT lease_owner FROM items WHERE lease_owner IS NOT NULL").fetchall()
+        for (owner,) in owners:
+            owner_host, _, pid = owner.rpartition(":")
+            if owner != self.owner and owner_host == host and pid.isdigit() and not process_exists(int(pid)):
+                self._conn.execute(
+                    "UPDATE items SET lease_owner = NULL, lease_expires = NULL, attempts = attempts + 1 "
+                    "WHERE lease_owner = ?",
+                    (owner,),
+                )
+
+    def _dump(self, item):
+        return json.dumps({key: value for key, value in item.items() if key not in ("state", "queue_unit", "rate_limited")})
+
+def get_work_queue():
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = WorkQueue(config.WORK_QUEUE_PATH)
+        return _queue
+
+def close_work_queue():
+    global _queue
+    with _queue_lock:
+        if _queue is not None:
+            _queue.close()
+            _queue = None
+
+def progress_report(shard=None):
+    counts, unsearched, total = get_work_queue().progress(shard)
+    unfinished = sum(count for state, count in counts.items() if state != STATES[-1])
+    return (
+        f"Work queue: {total - unsearched} of {total} search units searched, {counts[STATES[-1]]} listings scored, "
+        f"{unfinished} unfinished ({', '.join(f'{state}: {counts[state]}' for state in STATES[:-1])})"
+    )
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "status":
+        print("Usage: python work_queue.py status")
+        sys.exit(1)
+    print(progress_report())